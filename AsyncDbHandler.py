@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+
+class AsyncDbHandler:
+
+    """
+        Awaitable counterparts of the DbHandler queries.
+        Queries run on a thread pool over the pooled client of the wrapped DbHandler,
+        so several of them can be in flight while the event loop computes features.
+    """
+
+    def __init__(self, dbHandler, max_workers=8):
+        self.dbHandler = dbHandler
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def getTweetsForHashtag(self, hashtag="India", db=None):
+        return await self.__run(self.dbHandler.getTweetsForHashtag, hashtag, db=db)
+
+    async def getTweetsForHashtags(self, hashtags, db=None):
+        return await self.__run(self.dbHandler.getTweetsForHashtags, hashtags, db=db)
+
+    async def getTweetsByNum(self, num, skip=None, db=None):
+        return await self.__run(self.dbHandler.getTweetsByNum, num, skip=skip, db=db)
+
+    async def getNumOfTweets(self, db=None):
+        return await self.__run(self.dbHandler.getNumOfTweets, db=db)
+
+    def close(self):
+        """
+            Waits for the running queries and releases the worker threads
+        """
+        self.executor.shutdown(wait=True)
+
+    async def __run(self, method, *args, **kwargs):
+        """
+            Runs a blocking DbHandler method on the executor
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
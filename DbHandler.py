@@ -1,27 +1,274 @@
 from pymongo import MongoClient
+from pymongo.errors import CursorNotFound
 import pymongo
+from TweetCache import TweetCache
+import threading
+import time
+import os
+
+# tweet fields read by FeatureExtractor.get_hashtags_from_tweet
+_HASHTAG_FIELDS = ("truncated", "retweeted", "entities.hashtags", "extended_tweet.entities.hashtags",
+                   "retweeted_status.truncated", "retweeted_status.entities.hashtags",
+                   "retweeted_status.extended_tweet.entities.hashtags")
+# tweet fields read by FeatureExtractor.get_tweet_text
+_TEXT_FIELDS = ("text", "extended_tweet.full_text", "retweeted_status.truncated", "retweeted_status.text",
+                "retweeted_status.extended_tweet.full_text")
+# tweet fields read by TweetFeatureExtractor.contains_entities_element and is_retweet
+_ENTITY_FIELDS = ("truncated", "retweeted", "retweeted_status.truncated") + tuple(
+    path.format(element) for element in ("urls", "user_mentions")
+    for path in ("entities.{}", "extended_tweet.entities.{}", "retweeted_status.entities.{}",
+                 "retweeted_status.extended_tweet.entities.{}"))
 
 class DbHandler:
 
-    def __init__(self):
-        self.client = MongoClient('mongodb://localhost:27017/')
-        self.db = self.client["Test_db"]
+    """
+        PROJECTION_PROFILES maps a profile name to the tweet fields a feature family reads.
+        Extractors register the profiles they need and tweet fetches return the union of their fields.
+    """
+    PROJECTION_PROFILES = {
+        "hashtags": _HASHTAG_FIELDS,
+        "hashtag_features": ("id_str", "created_at") + _HASHTAG_FIELDS + _TEXT_FIELDS,
+        "ratio_features": ("user.id_str",) + _ENTITY_FIELDS,
+        "text_features": ("id_str",) + _TEXT_FIELDS,
+        "corpus_text": ("text",),
+        "time_series": ("created_at",),
+    }
+
+    HASHTAG_PATHS = ("entities.hashtags.text", "extended_tweet.entities.hashtags.text",
+                     "retweeted_status.entities.hashtags.text", "retweeted_status.extended_tweet.entities.hashtags.text")
+
+    ID_BATCH_SIZE = 50000 # tweet _ids per $in query, keeps queries of popular hashtags below the BSON size limit
+    INDEX_CHECK_SECONDS = 60 # how long the freshness of a hashtag index is trusted before it is checked again
+    INDEX_META_ID = "fingerprint" # _id of the document holding the collection fingerprint of a hashtag index
+
+    __clients = {} # (process id, uri, pool size) -> MongoClient shared by every handler of the process
+    __clients_lock = threading.Lock()
+
+    def __init__(self, uri="mongodb://localhost:27017/", database="Test_db", collection="plastic", pool_size=100,
+                 client=None, cache_size=500000):
+        """
+        :param uri: the MongoDB connection string
+        :param database: the database holding the tweets
+        :param collection: the default tweet collection of every query
+        :param pool_size: maximum number of pooled connections of the shared client
+        :param client: an already created client, such as a mongomock client in tests. Bypasses the shared pool
+        :param cache_size: maximum number of tweets kept by the per-hashtag tweet cache
+        """
+        if client is None:
+            client = self.getClient(uri, pool_size)
+        self.client = client
+        self.db = self.client[database]
+        self.collection = collection
+
+        self.tweet_converter = None # applied once to the tweets of hashtag lookups, see setTweetConverter
+        self.hashtag_indexes = {}  # collection name -> (whether a fresh hashtag index exists, time of the check)
+        self.projection_profiles = set()
+        self.tweet_cache = TweetCache(cache_size)
+
+    def addProjectionProfiles(self, profiles):
+        """
+            Registers the projection profiles an extractor needs. Unknown profiles raise a KeyError.
+        """
+        for profile in profiles:
+            if profile not in self.PROJECTION_PROFILES:
+                raise KeyError("Unknown projection profile: {}".format(profile))
+            self.projection_profiles.add(profile)
+
+    def getProjection(self, profiles=None):
+        """
+            :param profiles: the profiles to project on. Defaults to every registered profile
+            :return: the union of the profile fields as a projection, or None to fetch whole documents
+        """
+        if profiles is None:
+            profiles = self.projection_profiles
+        if not profiles:
+            return None
 
-        collection = self.db["plastic"]
-        collection.create_index([('user', pymongo.TEXT)])
+        fields = set()
+        for profile in profiles:
+            fields.update(self.PROJECTION_PROFILES[profile])
 
-    def getTweets(self, db="plastic"):
+        return {field: 1 for field in sorted(fields)}
+
+    @classmethod
+    def getClient(cls, uri, pool_size):
+        """
+            Returns the pooled client of the given uri, creating it on first use.
+            MongoClient is thread safe, so extractors and worker threads share it. It is not fork safe,
+            so the process id is part of the key and forked workers open their own pool.
+        """
+        key = (os.getpid(), uri, pool_size)
+        with cls.__clients_lock:
+            if key not in cls.__clients:
+                cls.__clients[key] = MongoClient(uri, maxPoolSize=pool_size)
+            return cls.__clients[key]
+
+    def ensureIndexes(self, db=None):
+        """
+            Creates the indexes hashtag and tweet lookups rely on. Existing indexes are left untouched.
+            The hashtag paths are arrays, so their indexes are multikey.
+        """
+        db = db or self.collection
+        collection = self.db[db]
+        for path in self.HASHTAG_PATHS:
+            collection.create_index([(path, pymongo.ASCENDING)])
+        collection.create_index([("created_at", pymongo.ASCENDING)])
+        collection.create_index([("id_str", pymongo.ASCENDING)])
+        collection.create_index([("user.id_str", pymongo.ASCENDING)]) # author lookups of incremental refreshes
+
+    def getTweets(self, db=None):
+        db = db or self.collection
         tweets = self.db[db].find({}) #use curly brackets to bypass default return limit
         return list(tweets)
 
-    def getTweetsByNum(self, num, skip=None, db="plastic"):
+    def getTweetsByNum(self, num, skip=None, db=None):
+        db = db or self.collection
         if skip != None:
-            tweets = self.db[db].find({}).skip(skip).limit(num)
+            tweets = self.db[db].find({}, self.getProjection()).skip(skip).limit(num)
         else:
-            tweets = self.db[db].find({}).limit(num)
+            tweets = self.db[db].find({}, self.getProjection()).limit(num)
         return list(tweets)
 
-    def getTweetTexts(self, num, skip=None, db="plastic"):
+    def streamTweets(self, batch_size, query=None, projection=None, db=None):
+        """
+            Yields all tweets matching the query in lists of batch_size, ordered by _id.
+            Batches are read from one server cursor. If the server drops the cursor, streaming resumes
+            from the last _id read, so no batch ever skips over documents already returned.
+        """
+        db = db or self.collection
+        query = query or {}
+        last_id = None
+        batch = []
+        while True:
+            if last_id is None:
+                range_query = query
+            else:
+                range_query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+
+            cursor = self.db[db].find(range_query, projection).sort("_id", pymongo.ASCENDING).batch_size(batch_size)
+            try:
+                for tweet in cursor:
+                    batch.append(tweet)
+                    last_id = tweet["_id"]
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+                break
+            except CursorNotFound:
+                continue
+            finally:
+                cursor.close()
+
+        if batch:
+            yield batch
+
+    def getTotalAttributes(self, query=None, db=None):
+        """
+            Counts retweets, distinct authors, tweets with urls and tweets with mentions on the server,
+            so only four numbers are sent back instead of the whole corpus.
+            :param query: restricts the counts to the matching tweets
+            :return: total_retweets, total_authors, total_urls, total_mentions
+        """
+        db = db or self.collection
+        pipeline = []
+        if query:
+            pipeline.append({"$match": query})
+        pipeline.extend([
+            {"$project": {
+                "author": "$user.id_str",
+                "retweet": {"$cond": [self.__exists("retweeted_status"), 1, 0]},
+                "url": {"$cond": [self.__containsEntitiesElement("urls"), 1, 0]},
+                "mention": {"$cond": [self.__containsEntitiesElement("user_mentions"), 1, 0]},
+            }},
+            # grouping by author first keeps the distinct author count off a single in-memory set
+            {"$group": {"_id": "$author", "retweets": {"$sum": "$retweet"}, "urls": {"$sum": "$url"},
+                        "mentions": {"$sum": "$mention"}}},
+            {"$group": {"_id": None, "authors": {"$sum": 1}, "retweets": {"$sum": "$retweets"},
+                        "urls": {"$sum": "$urls"}, "mentions": {"$sum": "$mentions"}}},
+        ])
+
+        totals = list(self.db[db].aggregate(pipeline, allowDiskUse=True))
+        if not totals:
+            return 0, 0, 0, 0
+
+        totals = totals[0]
+        return totals["retweets"], totals["authors"], totals["urls"], totals["mentions"]
+
+    def __exists(self, path):
+        """
+            Aggregation expression, true if the field exists, as python's `in` on the tweet json
+        """
+        return {"$ne": [{"$type": "$" + path}, "missing"]}
+
+    def __nonEmpty(self, path):
+        """
+            Aggregation expression, true if the array field exists and is not empty
+        """
+        return {"$gt": [{"$size": {"$ifNull": ["$" + path, []]}}, 0]}
+
+    def __containsEntitiesElement(self, element):
+        """
+            Aggregation expression equivalent to TweetFeatureExtractor.contains_entities_element
+        """
+        return {"$switch": {
+            "branches": [
+                {"case": {"$not": ["$truncated"]}, "then": self.__nonEmpty("entities." + element)},
+                {"case": self.__exists("extended_tweet"), "then": self.__nonEmpty("extended_tweet.entities." + element)},
+                {"case": {"$and": [self.__exists("retweeted_status"), "$retweeted"]}, "then": {"$cond": [
+                    "$retweeted_status.truncated",
+                    {"$or": [self.__nonEmpty("entities." + element),
+                             self.__nonEmpty("retweeted_status.extended_tweet.entities." + element)]},
+                    {"$or": [self.__nonEmpty("entities." + element),
+                             self.__nonEmpty("retweeted_status.entities." + element)]},
+                ]}},
+            ],
+            "default": False,
+        }}
+
+    def getLastId(self, db=None):
+        """
+            :return: the largest _id of the collection, or None if it is empty
+        """
+        db = db or self.collection
+        for tweet in self.db[db].find({}, {"_id": 1}).sort("_id", pymongo.DESCENDING).limit(1):
+            return tweet["_id"]
+        return None
+
+    def getCollectionFingerprint(self, db=None):
+        """
+            :return: (number of tweets, largest _id), which changes whenever tweets are inserted
+        """
+        return self.getNumOfTweets(db), self.getLastId(db)
+
+    def getDistinctAuthors(self, query=None, db=None):
+        """
+            :return: list of the distinct author ids of the tweets matching the query
+        """
+        db = db or self.collection
+        pipeline = []
+        if query:
+            pipeline.append({"$match": query})
+        pipeline.append({"$group": {"_id": "$user.id_str"}})
+        return [author["_id"] for author in self.db[db].aggregate(pipeline, allowDiskUse=True)]
+
+    def getKnownAuthorCount(self, authors, query=None, db=None):
+        """
+            :return: how many of the given authors wrote at least one tweet matching the query
+        """
+        db = db or self.collection
+        known = 0
+        for start in range(0, len(authors), self.ID_BATCH_SIZE):
+            match = {"user.id_str": {"$in": authors[start:start + self.ID_BATCH_SIZE]}}
+            if query:
+                match = {"$and": [query, match]}
+            pipeline = [{"$match": match}, {"$group": {"_id": "$user.id_str"}}, {"$count": "authors"}]
+            for count in self.db[db].aggregate(pipeline):
+                known += count["authors"]
+
+        return known
+
+    def getTweetTexts(self, num, skip=None, db=None):
+        db = db or self.collection
         if skip != None:
             texts = list(self.db[db].find({}, {"text":1, "_id":0}).skip(skip).limit(num))
         else:
@@ -32,7 +279,8 @@ class DbHandler:
 
         return text
 
-    def getTweetAuthors(self, num, skip=None, db="plastic"):
+    def getTweetAuthors(self, num, skip=None, db=None):
+        db = db or self.collection
 
         if skip != None:
             authors = list(self.db[db].find({}, {"user.id_str":1, "_id":0}).skip(skip).limit(num))
@@ -42,7 +290,8 @@ class DbHandler:
         authors = [item["user"]["id_str"] for item in authors]
         return authors
 
-    def getRetweetsNum(self, num, skip=None, db="plastic"):
+    def getRetweetsNum(self, num, skip=None, db=None):
+        db = db or self.collection
         if skip != None:
             retweets = list(self.db[db].find({"retweeted_status": {"$exists": "true"}}).skip(skip).limit(num))
         else:
@@ -50,7 +299,8 @@ class DbHandler:
 
         return len(retweets)
 
-    def getTweetById(self, id, db="plastic"):
+    def getTweetById(self, id, db=None):
+        db = db or self.collection
         tweet = self.db[db].find_one({"id_str": id})
         return tweet
 
@@ -62,14 +312,259 @@ class DbHandler:
     #     collection = self.db["topK"]
     #     collection.insert_many(tweets)
 
-    def getTweetsForHashtag(self, hashtag="India", db="plastic"):
+    def setTweetConverter(self, converter):
+        """
+            Converts the tweets of hashtag lookups once, before they are cached, e.g. to TweetRecords, so the cache
+            holds the converted tweets instead of the raw documents. Tweets cached before are dropped.
+            :param converter: callable converting a tweet json, None to keep the documents
+        """
+        self.tweet_converter = converter
+        self.tweet_cache.clear()
+
+    def getTweetsForHashtag(self, hashtag="India", db=None):
+        """
+            Returns the tweets of the hashtag, from the tweet cache when they have been fetched before
+        """
+        db = db or self.collection
+        key = self.__getCacheKey(hashtag, db)
+        tweets = self.tweet_cache.get(key)
+        if tweets is None:
+            tweets = self.__convertHashtagTweets({hashtag: self.__queryTweetsForHashtag(hashtag, db)})[hashtag]
+            self.tweet_cache.put(key, tweets)
+
+        return tweets
+
+    def __getCacheKey(self, hashtag, db):
+        """
+            Tweets fetched with a different projection are cached separately
+        """
+        projection = self.getProjection()
+        return db, hashtag, tuple(projection) if projection else None
+
+    def __queryTweetsForHashtag(self, hashtag, db):
+        if self.hasHashtagIndex(db):
+            return self.getTweetsFromHashtagIndex(hashtag, db)
+
         collection = self.db[db]
         exp1 = {"entities.hashtags.text" : "{}".format(hashtag)}
         exp2 = {"extended_tweet.entities.hashtags.text" : "{}".format(hashtag)}
         exp3 = {"retweeted_status.entities.hashtags.text": "{}".format(hashtag)}
         exp4 = {"retweeted_status.extended_tweet.entities.hashtags.text": "{}".format(hashtag)}
-        tweets = list(collection.find({"$or": [exp1, exp2, exp3, exp4]}))
+        tweets = list(collection.find({"$or": [exp1, exp2, exp3, exp4]}, self.getProjection()))
         return tweets
 
-    def getNumOfTweets(self, db="plastic"):
-        return self.db[db].count()
\ No newline at end of file
+    def getNumOfTweets(self, db=None):
+        db = db or self.collection
+        return self.db[db].count()
+
+    def getHashtagIndexName(self, db=None):
+        db = db or self.collection
+        return "{}_hashtag_index".format(db)
+
+    def hasHashtagIndex(self, db=None):
+        """
+            True if a hashtag index has been built for the given collection and it still has the fingerprint of the
+            collection. A stale index is not used, lookups fall back to the $or query of the hashtag paths.
+            The answer is cached for INDEX_CHECK_SECONDS.
+        """
+        db = db or self.collection
+        cached = self.hashtag_indexes.get(db)
+        if cached is not None and time.time() - cached[1] < self.INDEX_CHECK_SECONDS:
+            return cached[0]
+
+        fresh = False
+        if self.getHashtagIndexName(db) in self.db.list_collection_names():
+            fresh = self.getHashtagIndexFingerprint(db) == list(self.getCollectionFingerprint(db))
+            if not fresh and cached is None:
+                print("The hashtag index of {} is older than the collection, rebuild it with CREATE_INDEX. "
+                      "Querying the hashtag paths instead".format(db))
+
+        self.hashtag_indexes[db] = (fresh, time.time())
+        return fresh
+
+    def getHashtagIndexFingerprint(self, db=None):
+        """
+            :return: the collection fingerprint the live hashtag index was built for, or None
+        """
+        db = db or self.collection
+        meta = self.db[self.getHashtagIndexName(db)].find_one({"_id": self.INDEX_META_ID})
+        return meta["fingerprint"] if meta else None
+
+    def resetHashtagIndex(self, db=None):
+        """
+            Prepares an empty hashtag index next to the live one.
+            The live index keeps serving lookups until commitHashtagIndex replaces it.
+        """
+        db = db or self.collection
+        index = self.db[self.getHashtagIndexName(db) + "_building"]
+        index.drop()
+        index.create_index([("hashtag", pymongo.ASCENDING)])
+
+    def storeHashtagPostings(self, postings, db=None):
+        """
+            Stores a chunk of postings in the hashtag index being built.
+            :param postings: dictionary with hashtags as keys and lists of tweet _ids as values
+        """
+        db = db or self.collection
+        documents = [{"hashtag": hashtag, "tweet_ids": tweet_ids} for hashtag, tweet_ids in postings.items()]
+        if documents:
+            self.db[self.getHashtagIndexName(db) + "_building"].insert_many(documents, ordered=False)
+
+    def addHashtagPostings(self, postings, db=None):
+        """
+            Adds postings of new tweets to the live hashtag index, as storeHashtagPostings does for a build.
+            The index keeps its fingerprint until setHashtagIndexFingerprint, so it is not used while incomplete.
+        """
+        db = db or self.collection
+        documents = [{"hashtag": hashtag, "tweet_ids": tweet_ids} for hashtag, tweet_ids in postings.items()]
+        if documents:
+            self.db[self.getHashtagIndexName(db)].insert_many(documents, ordered=False)
+
+    def setHashtagIndexFingerprint(self, fingerprint, db=None):
+        """
+            Marks the live hashtag index as holding the postings of every tweet up to the fingerprint
+        """
+        db = db or self.collection
+        self.db[self.getHashtagIndexName(db)].replace_one({"_id": self.INDEX_META_ID},
+                                                          {"fingerprint": list(fingerprint)}, upsert=True)
+        self.hashtag_indexes.pop(db, None)
+
+    def commitHashtagIndex(self, fingerprint, db=None):
+        """
+            Replaces the live hashtag index with the one built, so an interrupted build is never used.
+            :param fingerprint: the collection fingerprint the index was built for
+        """
+        db = db or self.collection
+        index_name = self.getHashtagIndexName(db)
+        self.db[index_name + "_building"].insert_one({"_id": self.INDEX_META_ID, "fingerprint": list(fingerprint)})
+        self.db[index_name + "_building"].rename(index_name, dropTarget=True)
+        self.hashtag_indexes.pop(db, None)
+
+    def getTweetsFromHashtagIndex(self, hashtag="India", db=None):
+        """
+            Fetches the tweets of a hashtag through its postings instead of scanning the collection.
+        """
+        db = db or self.collection
+        postings = self.db[self.getHashtagIndexName(db)].find({"hashtag": hashtag}, {"tweet_ids": 1, "_id": 0})
+        tweet_ids = [tweet_id for posting in postings for tweet_id in posting["tweet_ids"]]
+
+        return self.getTweetsByIds(tweet_ids, db)
+
+    def getTweetsByIds(self, tweet_ids, db=None):
+        """
+            Fetches the tweets with the given _ids, ID_BATCH_SIZE ids per query.
+        """
+        db = db or self.collection
+        tweets = []
+        for start in range(0, len(tweet_ids), self.ID_BATCH_SIZE):
+            batch = tweet_ids[start:start + self.ID_BATCH_SIZE]
+            tweets.extend(self.db[db].find({"_id": {"$in": batch}}, self.getProjection()))
+        return tweets
+
+    def getTweetsForHashtags(self, hashtags, db=None):
+        """
+            Fetches the tweets of a block of hashtags in one round trip instead of one query per hashtag.
+            A tweet matching several hashtags of the block is fetched and decoded once and shared by their lists.
+            :return: dictionary with the hashtags as keys and lists of the tweets containing them as values
+        """
+        db = db or self.collection
+        hashtag_tweets = {}
+        for hashtag in hashtags:
+            hashtag_tweets[hashtag] = self.tweet_cache.get(self.__getCacheKey(hashtag, db))
+
+        # only the hashtags missing from the tweet cache are queried
+        hashtags = [hashtag for hashtag, tweets in hashtag_tweets.items() if tweets is None]
+        if not hashtags:
+            return hashtag_tweets
+
+        hashtag_tweets.update(self.__convertHashtagTweets(self.__queryTweetsForHashtags(hashtags, db)))
+        for hashtag in hashtags:
+            self.tweet_cache.put(self.__getCacheKey(hashtag, db), hashtag_tweets[hashtag])
+
+        return hashtag_tweets
+
+    def __convertHashtagTweets(self, hashtag_tweets):
+        """
+            Applies the tweet converter to every distinct tweet of the lists once, by _id, so a tweet carrying
+            several hashtags is converted once and its lists share the converted tweet
+        """
+        if self.tweet_converter is None:
+            return hashtag_tweets
+
+        converted = {}
+        for tweets in hashtag_tweets.values():
+            for tweet in tweets:
+                if tweet["_id"] not in converted:
+                    converted[tweet["_id"]] = self.tweet_converter(tweet)
+
+        return {hashtag: [converted[tweet["_id"]] for tweet in tweets] for hashtag, tweets in hashtag_tweets.items()}
+
+    def __queryTweetsForHashtags(self, hashtags, db):
+        hashtag_tweets = {hashtag: [] for hashtag in hashtags}
+
+        if self.hasHashtagIndex(db):
+            postings = self.db[self.getHashtagIndexName(db)].find({"hashtag": {"$in": hashtags}},
+                                                                  {"hashtag": 1, "tweet_ids": 1, "_id": 0})
+            tweet_hashtags = {} # tweet _id -> hashtags of the block it contains
+            for posting in postings:
+                for tweet_id in posting["tweet_ids"]:
+                    # a set, so a posting stored twice by an interrupted refresh does not repeat the tweet
+                    tweet_hashtags.setdefault(tweet_id, set()).add(posting["hashtag"])
+
+            for tweet in self.getTweetsByIds(list(tweet_hashtags), db):
+                for hashtag in tweet_hashtags[tweet["_id"]]:
+                    hashtag_tweets[hashtag].append(tweet)
+        else:
+            projection = self.getProjection()
+            if projection is not None:
+                # the hashtag arrays are needed to group the tweets, whatever the registered profiles
+                projection.update({field: 1 for field in self.PROJECTION_PROFILES["hashtags"]})
+
+            query = {"$or": [{path: {"$in": hashtags}} for path in self.HASHTAG_PATHS]}
+            for tweet in self.db[db].find(query, projection):
+                for hashtag in self.getHashtagTexts(tweet):
+                    if hashtag in hashtag_tweets:
+                        hashtag_tweets[hashtag].append(tweet)
+
+        return hashtag_tweets
+
+    def getHashtagCountEstimates(self, hashtags, db=None):
+        """
+            Cheap tweet counts per hashtag, read from the posting sizes of the hashtag index.
+            Without a fresh hashtag index, all hashtags are counted by one aggregation over the tweets matching
+            the $or query of the hashtag paths, which only reads the hashtag path indexes of ensureIndexes.
+            :return: dictionary of hashtag -> estimated number of tweets
+        """
+        db = db or self.collection
+        hashtags = list(hashtags)
+        if not self.hasHashtagIndex(db):
+            pipeline = [
+                {"$match": {"$or": [{path: {"$in": hashtags}} for path in self.HASHTAG_PATHS]}},
+                # the union of the paths, so a tweet is counted once per hashtag as getHashtagTexts reads it
+                {"$project": {"_id": 0, "hashtags": {"$setUnion": [{"$ifNull": ["$" + path, []]}
+                                                                    for path in self.HASHTAG_PATHS]}}},
+                {"$unwind": "$hashtags"},
+                {"$match": {"hashtags": {"$in": hashtags}}},
+                {"$group": {"_id": "$hashtags", "count": {"$sum": 1}}},
+            ]
+            return {count["_id"]: count["count"] for count in self.db[db].aggregate(pipeline, allowDiskUse=True)}
+
+        pipeline = [
+            {"$match": {"hashtag": {"$in": hashtags}}},
+            {"$group": {"_id": "$hashtag", "count": {"$sum": {"$size": "$tweet_ids"}}}},
+        ]
+        return {count["_id"]: count["count"] for count in self.db[self.getHashtagIndexName(db)].aggregate(pipeline)}
+
+    def getHashtagTexts(self, tweet):
+        """
+            :return: the set of hashtags found in any of the HASHTAG_PATHS of the tweet, as the $or queries match them
+        """
+        texts = set()
+        for path in self.HASHTAG_PATHS:
+            node = tweet
+            for key in path.split(".")[:-1]: # walk down to the hashtags array
+                node = node.get(key) if isinstance(node, dict) else None
+            if node:
+                texts.update(hashtag["text"] for hashtag in node)
+
+        return texts
@@ -0,0 +1,213 @@
+from scipy import sparse
+from array import array
+import numpy as np
+import os
+import sys
+
+# column -> arrow type name of the graph feature rows, for a FeatureSink
+GRAPH_SCHEMA = (
+    ("hashtag", "string"),
+    ("degree", "int64"),
+    ("weighted_degree", "int64"),
+    ("pagerank", "float64"),
+)
+
+class CooccurrenceGraph:
+
+    """
+        Sparse hashtag x hashtag co-occurrence graph of the whole collection, built in one scan.
+        Hashtags are numbered in order of first appearance. The graph holds:
+            matrix: symmetric CSR matrix, [i, j] the number of tweets carrying both hashtag i and hashtag j
+            appearances: number of tweets carrying each hashtag
+            cooccurrences: number of tweets carrying each hashtag together with another hashtag
+        The counts behind HashtagFeatureExtractor's co-occurrence flag are read from the graph instead of from
+        the tweets of every hashtag, and the graph features are computed with sparse matrix products.
+        Pairs are collected as COO triplets and summed into the matrix every MERGE_PAIRS pairs, so building costs a
+        few conversions of the matrix instead of one per chunk of tweets.
+        It is saved as the scipy .npz of the matrix and a .meta.npz of the hashtags and counts, keyed by a
+        collection fingerprint.
+    """
+
+    MERGE_PAIRS = 20000000 # pending pair entries summed into the matrix at once, 8 bytes each
+
+    def __init__(self, hashtags, matrix, appearances, cooccurrences):
+        self.hashtags = hashtags
+        self.ids = {hashtag: index for index, hashtag in enumerate(hashtags)}
+        self.matrix = matrix
+        self.appearances = appearances
+        self.cooccurrences = cooccurrences
+        self.pagerank = None
+
+    @classmethod
+    def build(cls, dbHandler, featureExtractor):
+        """
+            Scans the collection once
+            :param featureExtractor: resolves the hashtags of the tweets for the co-occurrence counts
+        """
+        ids = {}
+        appearances = []
+        cooccurrences = []
+        matrix = sparse.csr_matrix((0, 0), dtype=np.int64)
+
+        projection = dbHandler.getProjection(["hashtags"])
+        from tqdm import tqdm
+        rows = array("i")
+        columns = array("i")
+        with tqdm(total=dbHandler.getNumOfTweets()) as progress:
+            for tweets in dbHandler.streamTweets(featureExtractor.CHUNK_SIZE, projection=projection):
+                for tweet in tweets:
+                    # tweets belong to the hashtags of all their hashtag paths, as in the queries of the other
+                    # extraction modes, and co-occur when their resolved hashtags do, as get_hashtags_cooccurance counts
+                    tweet_hashtags = featureExtractor.get_hashtags_from_tweet(tweet)
+                    tweet_ids = []
+                    for hashtag in dbHandler.getHashtagTexts(tweet):
+                        hashtag_id = ids.get(hashtag)
+                        if hashtag_id is None:
+                            hashtag_id = ids[sys.intern(hashtag)] = len(ids)
+                            appearances.append(0)
+                            cooccurrences.append(0)
+                        appearances[hashtag_id] += 1
+                        cooccurrences[hashtag_id] += len(tweet_hashtags) > 1
+                        tweet_ids.append(hashtag_id)
+
+                    for index, first in enumerate(tweet_ids):
+                        for second in tweet_ids[index + 1:]:
+                            rows.extend((first, second))
+                            columns.extend((second, first))
+
+                if len(rows) >= cls.MERGE_PAIRS:
+                    matrix = get_merged(matrix, rows, columns, len(ids))
+                    rows = array("i")
+                    columns = array("i")
+                progress.update(len(tweets))
+
+        matrix = get_merged(matrix, rows, columns, len(ids))
+        return cls(list(ids), matrix, np.array(appearances, dtype=np.int64), np.array(cooccurrences, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """
+            :return: the saved graph, or None if there is none for this fingerprint
+        """
+        meta_path = get_meta_path(path)
+        if not os.path.exists(path) or not os.path.exists(meta_path):
+            return None
+
+        with np.load(meta_path) as arrays:
+            if arrays["fingerprint"].tolist() != [str(value) for value in fingerprint]:
+                return None
+            hashtags = arrays["hashtags"].tolist()
+            appearances = arrays["appearances"]
+            cooccurrences = arrays["cooccurrences"]
+
+        return cls(hashtags, sparse.load_npz(path).tocsr(), appearances, cooccurrences)
+
+    def save(self, path, fingerprint):
+        # np.savez and save_npz append .npz to names without it
+        temporary = path + ".tmp.npz"
+        sparse.save_npz(temporary, self.matrix)
+        os.replace(temporary, path)
+
+        # the meta file is written last, it holds the fingerprint the graph is loaded by
+        meta_path = get_meta_path(path)
+        temporary = meta_path + ".tmp.npz"
+        np.savez(temporary,
+                 fingerprint=np.array([str(value) for value in fingerprint]),
+                 hashtags=np.array(self.hashtags, dtype=np.str_),
+                 appearances=self.appearances,
+                 cooccurrences=self.cooccurrences)
+        os.replace(temporary, meta_path)
+
+    def __contains__(self, hashtag):
+        return hashtag in self.ids
+
+    def get_cooccurance_counts(self, hashtag):
+        """
+            :return: (tweets carrying the hashtag with another hashtag, tweets carrying the hashtag)
+        """
+        hashtag_id = self.ids[hashtag]
+        return int(self.cooccurrences[hashtag_id]), int(self.appearances[hashtag_id])
+
+    def get_degrees(self):
+        """
+            :return: number of distinct hashtags each hashtag co-occurs with
+        """
+        return np.diff(self.matrix.indptr)
+
+    def get_weighted_degrees(self):
+        """
+            :return: number of co-occurrences of each hashtag with other hashtags, summed over its neighbours
+        """
+        return np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def get_pageranks(self, damping=0.85, tolerance=1e-10, max_iterations=100):
+        """
+            PageRank of the hashtags over the co-occurrence weights, by power iteration.
+            Hashtags without neighbours spread their rank uniformly. Cached after the first call.
+        """
+        if self.pagerank is not None:
+            return self.pagerank
+
+        size = len(self.hashtags)
+        if not size:
+            return np.zeros(0)
+        weights = self.get_weighted_degrees().astype(np.float64)
+        dangling = weights == 0
+        inverse_weights = np.divide(1, weights, out=np.zeros(size), where=~dangling)
+
+        rank = np.full(size, 1 / size)
+        for _ in range(max_iterations):
+            # the matrix is symmetric, so its product spreads the rank along the edges of every hashtag
+            spread = self.matrix.dot(rank * inverse_weights)
+            updated = damping * (spread + rank[dangling].sum() / size) + (1 - damping) / size
+            converged = np.abs(updated - rank).sum() < tolerance
+            rank = updated
+            if converged:
+                break
+
+        self.pagerank = rank
+        return rank
+
+    def get_graph_features(self, hashtag):
+        """
+            :return: the degree, weighted degree and PageRank of a hashtag, 0 for hashtags not in the graph
+        """
+        if hashtag not in self.ids:
+            return {"degree": 0, "weighted_degree": 0, "pagerank": 0.0}
+
+        hashtag_id = self.ids[hashtag]
+        return {"degree": int(self.matrix.indptr[hashtag_id + 1] - self.matrix.indptr[hashtag_id]),
+                "weighted_degree": int(self.matrix.data[self.matrix.indptr[hashtag_id]:
+                                                        self.matrix.indptr[hashtag_id + 1]].sum()),
+                "pagerank": float(self.get_pageranks()[hashtag_id])}
+
+    def get_graph_rows(self, hashtags):
+        """
+            :return: the GRAPH_SCHEMA rows of the hashtags
+        """
+        rows = []
+        for hashtag in hashtags:
+            row = {"hashtag": hashtag}
+            row.update(self.get_graph_features(hashtag))
+            rows.append(row)
+        return rows
+
+def get_merged(matrix, rows, columns, size):
+    """
+        Sums the pending (row, column) pairs into matrix, grown to size x size.
+        Duplicates of a pair are summed when the triplets are converted, so the matrix holds the distinct pairs.
+    """
+    rows = np.frombuffer(rows, dtype=np.intc) if rows else np.zeros(0, dtype=np.int32)
+    columns = np.frombuffer(columns, dtype=np.intc) if columns else np.zeros(0, dtype=np.int32)
+    pairs = sparse.coo_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)), shape=(size, size))
+    return get_resized(matrix, size) + pairs.tocsr()
+
+def get_resized(matrix, size):
+    """
+        Grows a square CSR matrix to size x size with empty rows and columns for the new hashtags
+    """
+    indptr = np.concatenate([matrix.indptr, np.full(size - matrix.shape[0], matrix.indptr[-1], dtype=matrix.indptr.dtype)])
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(size, size))
+
+def get_meta_path(path):
+    return os.path.splitext(path)[0] + ".meta.npz"
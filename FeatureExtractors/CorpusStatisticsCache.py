@@ -0,0 +1,71 @@
+from .WordDivergence import WordDivergence
+import numpy as np
+import os
+
+class CorpusStatisticsCache:
+
+    """
+        On-disk cache of the corpus statistics of TweetFeatureExtractor.precalculateValues, as one .npz file.
+        The chunk word distributions are stored as the CSR arrays of the WordDivergence engine: the word ids,
+        log probabilities and row offsets of all chunks, and the vocabulary as one UTF-8 blob with the offset of
+        every word in it. Loading gives back the engine directly, without rebuilding the chunk lists.
+        The file is keyed by a collection fingerprint and is only loaded while the collection still has that
+        fingerprint.
+    """
+    TOTALS = ("total_tweets", "total_retweets", "total_authors", "total_urls", "total_mentions")
+
+    def __init__(self, path="corpus_statistics.npz"):
+        self.path = path
+
+    def load(self, fingerprint):
+        """
+            :return: the cached statistics, or None if there are none for this fingerprint. The chunk distributions
+            are returned as the "word_divergence" engine, total_tweet_keys and total_tweet_list are None
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with np.load(self.path) as arrays:
+            if "vocabulary_offsets" not in arrays.files: # written by an older version
+                return None
+            if arrays["fingerprint"].tolist() != self.get_fingerprint_strings(fingerprint):
+                return None
+
+            statistics = {name: int(value) for name, value in zip(self.TOTALS, arrays["totals"])}
+            vocabulary = arrays["vocabulary"].tobytes()
+            vocabulary_offsets = arrays["vocabulary_offsets"].tolist()
+            words = [vocabulary[start:end].decode("utf-8")
+                     for start, end in zip(vocabulary_offsets[:-1], vocabulary_offsets[1:])]
+            statistics["word_divergence"] = WordDivergence.fromArrays(words, arrays["word_ids"], arrays["offsets"],
+                                                                      arrays["log_probabilities"])
+
+        statistics["total_tweet_keys"] = None
+        statistics["total_tweet_list"] = None
+        return statistics
+
+    def save(self, statistics, fingerprint):
+        """
+            Writes the statistics returned by TweetFeatureExtractor.get_corpus_statistics for this fingerprint
+        """
+        word_divergence = statistics.get("word_divergence")
+        if word_divergence is None:
+            word_divergence = WordDivergence(statistics["total_tweet_keys"], statistics["total_tweet_list"])
+        words, word_ids, offsets, log_probabilities = word_divergence.get_arrays()
+
+        encoded = [word.encode("utf-8") for word in words]
+        vocabulary_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=vocabulary_offsets[1:])
+
+        temporary = self.path + ".tmp.npz" # np.savez appends .npz to names without it
+        np.savez(temporary,
+                 fingerprint=np.array(self.get_fingerprint_strings(fingerprint)),
+                 totals=np.array([statistics[name] for name in self.TOTALS], dtype=np.int64),
+                 vocabulary=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                 vocabulary_offsets=vocabulary_offsets,
+                 word_ids=np.asarray(word_ids, dtype=np.int32),
+                 log_probabilities=np.asarray(log_probabilities, dtype=np.float64),
+                 offsets=np.asarray(offsets, dtype=np.int64))
+        os.replace(temporary, self.path)
+
+    def get_fingerprint_strings(self, fingerprint):
+        return [str(value) for value in fingerprint]
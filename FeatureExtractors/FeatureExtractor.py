@@ -3,6 +3,9 @@ import re
 import itertools
 import operator
 import pandas as pd
+from collections import Counter
+from .SpaceSaving import SpaceSaving
+from .TweetRecord import TweetRecord
 
 class FeatureExtractor:
 
@@ -15,21 +18,33 @@ class FeatureExtractor:
     K = 10
     TWEETS_TO_FETCH = 10000
     CHUNK_SIZE = 1000
+    PROJECTION_PROFILES = () # DbHandler projection profiles of the tweet fields the extractor reads
+    VERSION = 1 # version of the feature rows, bump when their values or columns change so old runs are not resumed
 
-    def __init__(self, dbHandler=None, featureExtractor=None):
+    analyzer = None # vader analyzer shared by the extractors that score without a sentiment store
+
+    def __init__(self, dbHandler=None, featureExtractor=None, sentimentStore=None):
 
         if featureExtractor:
             self.dbHandler = featureExtractor.dbHandler
             self.tweets = featureExtractor.tweets
+            self.sentimentStore = featureExtractor.sentimentStore
         else:
             self.dbHandler = dbHandler
             self.tweets = []
+            self.sentimentStore = sentimentStore
+
+        if self.dbHandler:
+            self.dbHandler.addProjectionProfiles(self.PROJECTION_PROFILES)
 
     def get_hashtags_from_tweet(self, tweet):
         """
             Private method used to extract hashtags from the given tweet.
             :return: the hashtags
         """
+        if isinstance(tweet, TweetRecord):
+            return tweet.hashtags
+
         hashtags = []
         # simple tweet
         if not tweet["truncated"]:
@@ -66,31 +81,51 @@ class FeatureExtractor:
             1: neutral
             2: positive
         """
-        analyzer = SentimentIntensityAnalyzer()
+        if self.sentimentStore:
+            sentiments = self.sentimentStore.get_sentiments(self.tweets, self)
+            return {self.get_tweet_id(tweet): int(sentiment) for tweet, sentiment in zip(self.tweets, sentiments)}
+
+        analyzer = self.get_analyzer()
 
         tweet_sentiment = {}
         for tweet in self.tweets:
-            tweet_sentiment[tweet["id_str"]] = ""
+            tweet_sentiment[self.get_tweet_id(tweet)] = ""
 
         for tweet in self.tweets:
             text = self.get_tweet_text(tweet)
+            tweet_sentiment[self.get_tweet_id(tweet)] = self.get_text_sentiment(analyzer, text)
 
-            vs = analyzer.polarity_scores(text)
-            sentiment = vs['compound']
+        return tweet_sentiment
 
-            if sentiment >= 0.5:
-                tweet_sentiment[tweet["id_str"]] = 2
-            elif sentiment > -0.5 and sentiment < 0.5:
-                tweet_sentiment[tweet["id_str"]] = 1
-            else:
-                tweet_sentiment[tweet["id_str"]] = 0
+    def get_analyzer(self):
+        """
+            returns the shared vader analyzer, created on first use since loading its lexicon is expensive
+        """
+        if FeatureExtractor.analyzer is None:
+            FeatureExtractor.analyzer = SentimentIntensityAnalyzer()
+        return FeatureExtractor.analyzer
 
-        return tweet_sentiment
+    def get_text_sentiment(self, analyzer, text):
+        """
+            returns the 2/1/0 sentiment class of a text, scored by the given vader analyzer
+        """
+        vs = analyzer.polarity_scores(text)
+        sentiment = vs['compound']
+
+        if sentiment >= 0.5:
+            return 2
+        elif sentiment > -0.5 and sentiment < 0.5:
+            return 1
+        else:
+            return 0
 
     def get_tweet_text(self, tweet):
         """
             returns the text of the given tweet json
         """
+        if isinstance(tweet, TweetRecord):
+            return tweet.text
+
         if "extended_tweet" in tweet:
             text = tweet["extended_tweet"]["full_text"]
         elif "retweeted_status" in tweet and (not tweet["retweeted_status"]["truncated"]):
@@ -102,6 +137,22 @@ class FeatureExtractor:
 
         return str(text)
 
+    def get_tweet_id(self, tweet):
+        """
+            returns the id_str of the given tweet json or record
+        """
+        if isinstance(tweet, TweetRecord):
+            return tweet.id
+        return tweet["id_str"]
+
+    def get_created_at(self, tweet):
+        """
+            returns the creation datetime of the given tweet json or record
+        """
+        if isinstance(tweet, TweetRecord):
+            return tweet.get_datetime()
+        return tweet["created_at"]
+
     def get_sanitized_text(self, text):
         """
             Removes urls from given text
@@ -135,45 +186,105 @@ class FeatureExtractor:
 
     def create_hashtag_csv(self, ioHandler):
         """
-        :param k: number of top hashtags
+            Writes every distinct hashtag of the collection to hashtags.csv
         """
+        self.create_hashtag_csvs(ioHandler, top_k_output=None)
 
-        chunk_size = self.CHUNK_SIZE
-        skip = 0
+    def create_top_k_csv(self, ioHandler, output="top_k.csv", capacity=10000, exact=False):
+        """
+            Writes the K most used hashtags of the collection to output
+            :param capacity: number of counters of the Space-Saving sketch, bounds memory and the count error
+            :param exact: count the sketch candidates exactly in a second pass
+        """
+        self.create_hashtag_csvs(ioHandler, hashtags_output=None, top_k_output=output, capacity=capacity,
+                                 exact=exact)
 
+    def create_hashtag_csvs(self, ioHandler, hashtags_output="hashtags.csv", top_k_output="top_k.csv",
+                            capacity=10000, exact=False):
+        """
+            Writes hashtags.csv and top_k.csv from one pass over the collection.
+            Hashtag occurrences are counted with a Space-Saving sketch of capacity counters instead of a list of
+            every occurrence, so memory does not grow with the corpus. Approximate counts are overestimated by
+            at most the reported error bound.
+            :param hashtags_output: CSV of every distinct hashtag, None to skip it
+            :param top_k_output: CSV of the K most used hashtags, None to skip it
+            :param capacity: number of counters of the sketch
+            :param exact: count the sketch candidates exactly in a second pass, which makes the top K exact
+            whenever the K-th count exceeds the error bound
+        """
         total_tweets = self.dbHandler.getNumOfTweets()
         hashtags = set()
+        sketch = SpaceSaving(capacity)
+        projection = self.dbHandler.getProjection(["hashtags"])
         from tqdm import tqdm
-        for _ in tqdm(range(0, total_tweets, chunk_size)):
-            tweets = (el for el in self.dbHandler.getTweetsByNum(chunk_size, skip=skip))  # create generator from list
-            for tweet in tweets:
-                hashtags.update(self.get_hashtags_from_tweet(tweet))
-
-            skip += chunk_size
-
-        ioHandler.writeListToCSV(hashtags)
-
-    def create_top_k_csv(self, ioHandler, output="top_k.csv"):
+        with tqdm(total=total_tweets) as progress:
+            for tweets in self.dbHandler.streamTweets(self.CHUNK_SIZE, projection=projection):
+                for tweet in tweets:
+                    tweet_hashtags = self.get_hashtags_from_tweet(tweet)
+                    if hashtags_output:
+                        hashtags.update(tweet_hashtags)
+                    sketch.update(tweet_hashtags)
+
+                progress.update(len(tweets))
+
+        if hashtags_output:
+            ioHandler.writeListToCSV(hashtags, my_csv=hashtags_output)
+
+        if top_k_output:
+            if exact:
+                top = self.count_candidates(list(sketch.counts))
+            else:
+                top = sketch.get_top_k(self.K)
+                print("Top hashtag counts are overestimated by at most", sketch.get_error_bound())
+                for hashtag, count, error in top:
+                    print(hashtag, count, "-", error)
 
-        chunk_size = self.CHUNK_SIZE
-        skip = 0
+            ioHandler.writeListToCSV([hashtag for hashtag, _, _ in top], my_csv=top_k_output)
 
-        total_tweets = self.dbHandler.getNumOfTweets()
-        hashtags = []
+    def count_candidates(self, candidates):
+        """
+            Counts the occurrences of the candidate hashtags exactly, in a second pass over the collection
+            :return: list of (hashtag, count, 0) tuples of the K most used candidates
+        """
+        candidates = set(candidates)
+        counter = Counter()
+        projection = self.dbHandler.getProjection(["hashtags"])
         from tqdm import tqdm
-        for _ in tqdm(range(0, total_tweets, chunk_size)):
-            tweets = (el for el in self.dbHandler.getTweetsByNum(chunk_size, skip=skip))  # create generator from list
-            for tweet in tweets:
-                hashtags.extend(self.get_hashtags_from_tweet(tweet))
-
-            skip += chunk_size
+        with tqdm(total=self.dbHandler.getNumOfTweets()) as progress:
+            for tweets in self.dbHandler.streamTweets(self.CHUNK_SIZE, projection=projection):
+                for tweet in tweets:
+                    counter.update(hashtag for hashtag in self.get_hashtags_from_tweet(tweet) if hashtag in candidates)
 
-        from collections import Counter
-        counter = Counter(hashtags)
-        top = counter.most_common(10)
-        top = [el[0] for el in top]
+                progress.update(len(tweets))
 
+        return [(hashtag, count, 0) for hashtag, count in counter.most_common(self.K)]
 
-        ioHandler.writeListToCSV(top, my_csv=output)
-
+    def create_hashtag_index(self):
+        """
+            Builds the hashtag -> tweet _id posting index in one pass over the collection.
+            Every chunk of tweets is stored as one posting document per hashtag, so documents stay small
+            even for the most popular hashtags.
+            Postings hold the hashtags of every hashtag path of a tweet, as DbHandler.getHashtagTexts reads them,
+            so index lookups return the same tweets as the $or query of the paths.
+            The index covers the tweets up to the current collection fingerprint and is only used while the
+            collection still has it.
+        """
+        fingerprint = self.dbHandler.getCollectionFingerprint()
+        total_tweets, last_id = fingerprint
+        self.dbHandler.resetHashtagIndex()
+        projection = self.dbHandler.getProjection(["hashtags"])
+        from tqdm import tqdm
+        with tqdm(total=total_tweets) as progress:
+            if last_id is not None:
+                for tweets in self.dbHandler.streamTweets(self.CHUNK_SIZE, query={"_id": {"$lte": last_id}},
+                                                          projection=projection):
+                    postings = {}
+                    for tweet in tweets:
+                        for hashtag in self.dbHandler.getHashtagTexts(tweet):
+                            postings.setdefault(hashtag, []).append(tweet["_id"])
+
+                    self.dbHandler.storeHashtagPostings(postings)
+                    progress.update(len(tweets))
+
+        self.dbHandler.commitHashtagIndex(fingerprint)
 
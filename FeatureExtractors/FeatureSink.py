@@ -0,0 +1,150 @@
+import csv
+import os
+
+# column -> arrow type name of the rows createFeatureCSV writes, in file order
+FEATURE_SCHEMA = (
+    ("hashtag", "string"),
+    ("char_length", "int64"),
+    ("contains_digits", "int8"),
+    ("all_caps", "int8"),
+    ("any_caps", "int8"),
+    ("no_caps", "int8"),
+    ("special_signals", "int8"),
+    ("cooccurance", "int8"),
+    ("location", "float64"),
+    ("hashtag_sentiment", "int8"),
+    ("popularity", "int64"),
+    ("created_at", "float64"),
+    ("lifespan", "float64"),
+    ("tweet_ratio", "float64"),
+    ("author_ratio", "float64"),
+    ("retweet_ratio", "float64"),
+    ("mention_ratio", "float64"),
+    ("url_ratio", "float64"),
+    ("word_divergence_distribution", "float64"),
+)
+
+# column added to FEATURE_SCHEMA when the tweet feature extractor has a topic model
+TOPIC_SCHEMA = (("topic", "int64"),)
+
+FORMATS = ("csv", "parquet", "feather")
+
+def get_typed_row(row, schema=FEATURE_SCHEMA):
+    """
+        Converts the values of a row read from a feature file, as text or numpy scalars, to the types of the schema
+    """
+    types = dict(schema)
+    typed = {}
+    for column, value in row.items():
+        if types[column] == "string":
+            typed[column] = str(value)
+        elif types[column].startswith("int"):
+            typed[column] = int(value)
+        else:
+            typed[column] = float(value)
+    return typed
+
+class FeatureSink:
+
+    """
+        Buffered writer of feature rows with a fixed, typed schema.
+        Rows are matched to the schema by column name, so the key order of the feature dictionaries does not matter,
+        and rows with missing or unknown columns are rejected instead of silently shifting columns.
+        Rows are buffered and written in batches of buffer_rows, with the file kept open:
+            csv: text rows, floats written with their shortest exact representation
+            parquet, feather: binary columnar files with the schema types, written through pyarrow
+        Binary files are only complete once the sink is closed.
+    """
+
+    def __init__(self, path, format="csv", schema=FEATURE_SCHEMA, buffer_rows=1000, append=False):
+        """
+        :param format: one of FORMATS
+        :param append: csv only, add rows to an existing file instead of replacing it
+        """
+        if format not in FORMATS:
+            raise ValueError("Unknown feature format: {}".format(format))
+        if append and format != "csv":
+            raise ValueError("Only csv feature files can be appended to")
+
+        self.path = path
+        self.format = format
+        self.schema = schema
+        self.columns = [column for column, _ in schema]
+        self.buffer_rows = buffer_rows
+        self.buffer = []
+
+        if format == "csv":
+            write_header = not append or not os.path.exists(path) or not os.path.getsize(path)
+            self.file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+            if write_header:
+                self.writer.writerow(self.columns)
+        else:
+            import pyarrow as pa
+            self.arrow_schema = pa.schema([(column, pa.type_for_alias(type_name)) for column, type_name in schema])
+            if format == "parquet":
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(path, self.arrow_schema)
+            else:
+                self.file = pa.OSFile(path, "wb")
+                self.writer = pa.ipc.new_file(self.file, self.arrow_schema) # feather v2 is the arrow ipc file format
+
+    def write_row(self, row):
+        self.buffer.append(self.get_values(row))
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def write_rows(self, rows):
+        """
+            Writes a whole block of rows, e.g. the rows of a hashtag block of a parallel worker
+        """
+        self.buffer.extend(self.get_values(row) for row in rows)
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    def get_values(self, row):
+        """
+            :return: the values of a feature row in schema order
+        """
+        if len(row) != len(self.columns) or any(column not in row for column in self.columns):
+            unknown = set(row) - set(self.columns)
+            missing = set(self.columns) - set(row)
+            raise KeyError("Feature row does not match the schema, unknown: {}, missing: {}".format(
+                sorted(unknown), sorted(missing)))
+
+        return [row[column] for column in self.columns]
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        if self.format == "csv":
+            self.writer.writerows(self.buffer)
+            self.file.flush()
+        else:
+            import pyarrow as pa
+            arrays = [pa.array([values[index] for values in self.buffer], type=field.type)
+                      for index, field in enumerate(self.arrow_schema)]
+            batch = pa.RecordBatch.from_arrays(arrays, names=self.columns)
+            if self.format == "parquet":
+                self.writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                self.writer.write_batch(batch)
+
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        if self.format == "csv":
+            self.file.close()
+        elif self.format == "parquet":
+            self.writer.close()
+        else:
+            self.writer.close()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+
+class FeatureStore:
+
+    """
+        Column store of a feature table for model training, opened memory mapped.
+        The store directory holds one .npy file per column and a meta.json:
+            <column>.npy: float32 values of every feature column, float64 for the PRECISE_COLUMNS
+            hashtag_codes.npy, hashtag_categories.npy: the hashtag column as int32 categorical codes
+            mask_<name>.npy: precomputed row masks, such as the train/test split
+        Columns are only read when selected and mapped rather than loaded, so opening a store is instant and
+        the operating system shares the pages instead of every reader keeping a copy.
+    """
+    META_FILE = "meta.json"
+    HASHTAG = "hashtag"
+    PRECISE_COLUMNS = ("created_at", "lifespan") # epoch seconds and durations, float32 rounds them by up to minutes
+    VERSION = 2 # layout of the store, stores of another version are rebuilt
+
+    def __init__(self, path="feature_store"):
+        self.path = path
+        with open(os.path.join(path, self.META_FILE), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        self.columns = meta["columns"]
+        self.masks = meta["masks"]
+        self.rows = meta["rows"]
+
+    @staticmethod
+    def build(data, path="feature_store", masks=None):
+        """
+            Writes a feature table as a store
+            :param data: DataFrame with a hashtag column and numeric feature columns
+            :param masks: dictionary of mask name -> boolean array over the rows of data
+        """
+        os.makedirs(path, exist_ok=True)
+        masks = masks or {}
+
+        columns = [column for column in data.columns if column != FeatureStore.HASHTAG]
+        for column in columns:
+            dtype = np.float64 if column in FeatureStore.PRECISE_COLUMNS else np.float32
+            np.save(os.path.join(path, column + ".npy"), data[column].values.astype(dtype))
+
+        hashtags = pd.Categorical(data[FeatureStore.HASHTAG].astype(str))
+        np.save(os.path.join(path, "hashtag_codes.npy"), hashtags.codes.astype(np.int32))
+        np.save(os.path.join(path, "hashtag_categories.npy"), np.asarray(hashtags.categories, dtype=np.str_))
+
+        for name, mask in masks.items():
+            np.save(os.path.join(path, "mask_{}.npy".format(name)), np.asarray(mask, dtype=np.bool_))
+
+        # meta.json is written last, a store without it is incomplete
+        with open(os.path.join(path, FeatureStore.META_FILE), "w", encoding="utf-8") as meta_file:
+            json.dump({"version": FeatureStore.VERSION, "columns": columns, "masks": list(masks), "rows": len(data)},
+                      meta_file)
+
+    @staticmethod
+    def buildTrainTest(data, test_hashtags, path="feature_store"):
+        """
+            Writes a store with "train" and "test" masks, test holding the rows of test_hashtags
+        """
+        test = data[FeatureStore.HASHTAG].astype(str).isin(set(map(str, test_hashtags))).values
+        FeatureStore.build(data, path, {"train": ~test, "test": test})
+
+    @staticmethod
+    def isCurrent(path, sources):
+        """
+            :return: True if the store exists, has the current layout and is newer than all of its source files
+        """
+        meta = os.path.join(path, FeatureStore.META_FILE)
+        if not os.path.exists(meta):
+            return False
+        with open(meta, encoding="utf-8") as meta_file:
+            if json.load(meta_file).get("version") != FeatureStore.VERSION:
+                return False
+        return all(os.path.getmtime(source) <= os.path.getmtime(meta) for source in sources)
+
+    def get_column(self, column, mask=None):
+        """
+            :return: the memory mapped values of a feature column, only copied when a mask is given
+        """
+        values = np.load(os.path.join(self.path, column + ".npy"), mmap_mode="r")
+        return values if mask is None else values[self.get_mask(mask)]
+
+    def get_mask(self, name):
+        return np.load(os.path.join(self.path, "mask_{}.npy".format(name)), mmap_mode="r")
+
+    def get_hashtags(self, mask=None):
+        """
+            :return: the hashtag column as a pandas Categorical
+        """
+        codes = np.load(os.path.join(self.path, "hashtag_codes.npy"), mmap_mode="r")
+        if mask is not None:
+            codes = codes[self.get_mask(mask)]
+        categories = np.load(os.path.join(self.path, "hashtag_categories.npy"))
+        return pd.Categorical.from_codes(np.asarray(codes), categories)
+
+    def get_matrix(self, columns=None, mask=None):
+        """
+            :return: float32 rows x columns array of the selected columns, the form the predictors fit on.
+            The PRECISE_COLUMNS are only rounded to float32 here, they keep their precision on disk
+        """
+        columns = self.columns if columns is None else columns
+        rows = self.rows if mask is None else int(np.count_nonzero(self.get_mask(mask)))
+        matrix = np.empty((rows, len(columns)), dtype=np.float32)
+        for index, column in enumerate(columns):
+            matrix[:, index] = self.get_column(column, mask)
+        return matrix
+
+    def read(self, columns=None, mask=None):
+        """
+            :return: DataFrame of the hashtag and the selected feature columns of the rows of a mask.
+            The frame wraps the float32 matrix of get_matrix, so the selected rows are materialized once, and the
+            PRECISE_COLUMNS are added as float64 columns of their own.
+            The predictors still drop the hashtag and label columns into copies of their own.
+        """
+        columns = columns or self.columns
+        matrix_columns = [column for column in columns if column not in self.PRECISE_COLUMNS]
+        data = pd.DataFrame(self.get_matrix(matrix_columns, mask), columns=matrix_columns, copy=False)
+        for position, column in enumerate(columns):
+            if column in self.PRECISE_COLUMNS:
+                data.insert(position, column, np.asarray(self.get_column(column, mask)))
+        data.insert(0, self.HASHTAG, self.get_hashtags(mask))
+        return data
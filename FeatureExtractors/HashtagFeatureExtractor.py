@@ -1,5 +1,5 @@
 from .FeatureExtractor import FeatureExtractor
-import numpy as np
+from .HashtagLocator import HashtagLocator
 import re
 import time
 from datetime import datetime, timedelta
@@ -8,23 +8,22 @@ class HashtagFeatureExtractor(FeatureExtractor):
 
     __COOCCURANCE_THRESHOLD = 0.4
     __LOCATION_THRESHOLD = 0.25
+    PROJECTION_PROFILES = ("hashtag_features",)
 
-    def get_hashtag_features(self, hashtag):
+    locator = None # hashtag locator shared by all extractors, so its memo table lasts the whole run
+    cooccurrence_graph = None # CooccurrenceGraph the co-occurrence counts are read from, when set
+
+    def get_hashtag_features(self, hashtag, tweets=None):
         """
             stores the hashtag related features
+            :param tweets: the tweets of the hashtag if already fetched, e.g. by DbHandler.getTweetsForHashtags
         """
         self.hashtag = hashtag
-        self.tweets = self.dbHandler.getTweetsForHashtag(self.hashtag)
+        if tweets is None:
+            tweets = self.dbHandler.getTweetsForHashtag(self.hashtag)
+        self.tweets = tweets
 
-        hashtag_features = {}
-        # char length feature
-        hashtag_features["char_length"] = self.get_hashtags_length()
-        # orthography related features
-        hashtag_features["contains_digits"] = self.get_hashtags_contain_digits()
-        hashtag_features["all_caps"] = self.get_hashtags_all_caps()
-        hashtag_features["any_caps"] = self.get_hashtags_any_caps()
-        hashtag_features["no_caps"] = self.get_hashtags_no_caps()
-        hashtag_features["special_signals"] = self.get_hashtags_special_signals()
+        hashtag_features = self.get_hashtag_text_features()
         # co-occurance feature
         hashtag_features["cooccurance"] = self.get_hashtags_cooccurance()
         # location feature
@@ -38,6 +37,21 @@ class HashtagFeatureExtractor(FeatureExtractor):
 
         return hashtag_features
 
+    def get_hashtag_text_features(self):
+        """
+            returns the features of self.hashtag that depend only on the hashtag text
+        """
+        hashtag_features = {}
+        # char length feature
+        hashtag_features["char_length"] = self.get_hashtags_length()
+        # orthography related features
+        hashtag_features["contains_digits"] = self.get_hashtags_contain_digits()
+        hashtag_features["all_caps"] = self.get_hashtags_all_caps()
+        hashtag_features["any_caps"] = self.get_hashtags_any_caps()
+        hashtag_features["no_caps"] = self.get_hashtags_no_caps()
+        hashtag_features["special_signals"] = self.get_hashtags_special_signals()
+
+        return hashtag_features
 
     def get_hashtags_created_at_and_lifespan(self):
         """
@@ -46,7 +60,7 @@ class HashtagFeatureExtractor(FeatureExtractor):
         """
         hashtag_creation_time = []
         for tweet in self.tweets:
-            created_at = tweet["created_at"]
+            created_at = self.get_created_at(tweet)
             hashtag_creation_time.append(created_at)
 
         if len(hashtag_creation_time) == 1:
@@ -71,6 +85,10 @@ class HashtagFeatureExtractor(FeatureExtractor):
             1: neutral
             2: positive
         """
+        if self.sentimentStore:
+            # one bulk read for all the tweets of the hashtag
+            return self.most_common(self.sentimentStore.get_sentiments(self.tweets, self).tolist())
+
         hashtag_sentiment = []
         tweet_sentiment = self.get_tweets_sentiment()
         for _, sentiment in tweet_sentiment.items():
@@ -84,28 +102,16 @@ class HashtagFeatureExtractor(FeatureExtractor):
             finds the location of hashtag inside the corresponding tweet text
             The ratio is calculated as the mean of the distinct hashtag ratios of each tweet it appears in
         """
+        texts = (self.get_tweet_text(tweet) for tweet in self.tweets)
+        return self.get_locator().get_location(texts, self.hashtag)
 
-        hashtag_ratio = []
-
-        for tweet in self.tweets:
-
-            text = self.get_tweet_text(tweet)
-            text = re.sub(r"[^\w\s#]", ' ', text)# replace special characters with a space
-            word_list = text.split()
-
-            position = -1 # will be returned if hashtag cannot be matched
-            for index, word in enumerate(word_list):
-                if re.search(r"\B#" + re.escape(self.hashtag) + r"\b", word, re.UNICODE):
-                    position = index
-            if position == -1:
-                return position
-            # pattern = "#{}".format(self.hashtag)
-            #
-            # position = word_list.index(pattern)
-            ratio = position / len(word_list)
-            hashtag_ratio.append(ratio)
-
-        return np.array(hashtag_ratio).mean()
+    def get_locator(self):
+        """
+            returns the shared hashtag locator
+        """
+        if HashtagFeatureExtractor.locator is None:
+            HashtagFeatureExtractor.locator = HashtagLocator()
+        return HashtagFeatureExtractor.locator
 
     def get_hashtags_cooccurance(self):
         """
@@ -113,6 +119,9 @@ class HashtagFeatureExtractor(FeatureExtractor):
             1: true
             0: false
         """
+        if self.cooccurrence_graph is not None and self.hashtag in self.cooccurrence_graph:
+            cooccurance_counter, appearance_counter = self.cooccurrence_graph.get_cooccurance_counts(self.hashtag)
+            return self.get_cooccurance_flag(cooccurance_counter, appearance_counter)
 
         appearance_counter = len(self.tweets)
         cooccurance_counter = 0
@@ -123,6 +132,12 @@ class HashtagFeatureExtractor(FeatureExtractor):
             if len(hashtags) > 1:
                 cooccurance_counter += 1
 
+        return self.get_cooccurance_flag(cooccurance_counter, appearance_counter)
+
+    def get_cooccurance_flag(self, cooccurance_counter, appearance_counter):
+        """
+            returns 1 if the share of the hashtag appearances collocated with other hashtags reaches the threshold
+        """
         ratio = cooccurance_counter / appearance_counter
 
         return 1 if ratio >= self.__COOCCURANCE_THRESHOLD else 0
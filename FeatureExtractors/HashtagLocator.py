@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import re
+
+class HashtagLocator:
+
+    """
+        Finds the word positions of all hashtags of a tweet text in one pass.
+        A text is split into words once, with a precompiled pattern, and the position of every hashtag it
+        contains is read from the words, so locating n hashtags costs one tokenization instead of n regex
+        searches per word. Results are memoized by text in a bounded LRU table, so retweets and the
+        tweets shared by several hashtags are tokenized once.
+    """
+    SPECIAL_CHARACTERS = re.compile(r"[^\w\s#]")
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.__memo = OrderedDict() # text -> (hashtag -> last word position, number of words)
+
+    def get_positions(self, text):
+        """
+            A word matches #hashtag as the pattern \\B#hashtag\\b would: the # starts the word or follows
+            another #, and the hashtag runs up to the next # or the end of the word.
+            :return: dictionary of hashtag -> index of the last word matching it, and the number of words
+        """
+        memo = self.__memo
+        if text in memo:
+            memo.move_to_end(text)
+            return memo[text]
+
+        words = self.SPECIAL_CHARACTERS.sub(" ", text).split() # replace special characters with a space
+        positions = {}
+        for index, word in enumerate(words):
+            if "#" not in word:
+                continue
+            parts = word.split("#")
+            for previous, part in zip(parts, parts[1:]):
+                if part and not previous:
+                    positions[part] = index
+
+        memo[text] = positions, len(words)
+        if len(memo) > self.max_entries:
+            memo.popitem(last=False)
+
+        return positions, len(words)
+
+    def get_ratio(self, text, hashtag):
+        """
+            :return: the position of the hashtag relative to the length of the text, or -1 if it is not found
+        """
+        positions, length = self.get_positions(text)
+        if hashtag not in positions:
+            return -1
+        return positions[hashtag] / length
+
+    def get_location(self, texts, hashtag):
+        """
+            :return: the mean ratio of the hashtag over the texts, or -1 if any text does not contain it
+        """
+        ratios = []
+        for text in texts:
+            ratio = self.get_ratio(text, hashtag)
+            if ratio == -1:
+                return -1
+            ratios.append(ratio)
+
+        return sum(ratios) / len(ratios) if ratios else float("nan")
+
+    def get_locations(self, texts, hashtags):
+        """
+            Batch version of get_location over the texts of many hashtags
+            :param texts: dictionary of hashtag -> texts of its tweets
+            :return: dictionary of hashtag -> location
+        """
+        return {hashtag: self.get_location(texts[hashtag], hashtag) for hashtag in hashtags}
+
+    def clear(self):
+        self.__memo.clear()
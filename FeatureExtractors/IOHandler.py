@@ -30,6 +30,19 @@ class IOHandler:
     def readFromCSV(self, csv="features.csv"):
         return pd.read_csv(csv)
 
+    def readFeatures(self, path="features.csv"):
+        """
+            Reads a feature file written by FeatureSink, in the format given by its extension
+        """
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path)
+        elif path.endswith(".feather"):
+            # pandas reads feather through the feather-format package, the arrow ipc reader needs only pyarrow
+            import pyarrow as pa
+            with pa.memory_map(path, "r") as source:
+                return pa.ipc.open_file(source).read_all().to_pandas()
+        return pd.read_csv(path)
+
     def top_k_hashtags_CSV(self, data, k):
         top_k_popular_hashtags = data.sort_values(by='popularity', ascending=False).head(k)
         top_k_popular_hashtags.to_csv("top_k.csv", encoding='utf-8', index=False)
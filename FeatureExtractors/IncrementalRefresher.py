@@ -0,0 +1,212 @@
+from .FeatureExtractor import FeatureExtractor
+from .HashtagFeatureExtractor import HashtagFeatureExtractor
+from .TweetFeatureExtractor import TweetFeatureExtractor
+from .FeatureSink import FeatureSink, FEATURE_SCHEMA, get_typed_row
+from .IOHandler import IOHandler
+import os
+import pickle
+
+RATIO_TOTALS = { # ratio column -> corpus total it is divided by
+    "tweet_ratio": "total_tweets",
+    "author_ratio": "total_authors",
+    "retweet_ratio": "total_retweets",
+    "mention_ratio": "total_mentions",
+    "url_ratio": "total_urls",
+}
+
+class IncrementalRefresher(FeatureExtractor):
+
+    """
+        Refreshes features.csv with the tweets inserted since the last refresh, without rescanning the corpus.
+        The refresh state stores the corpus statistics of TweetFeatureExtractor with an _id watermark: the last
+        tweet they include and the first tweet of their last, possibly partial, chunk. A refresh
+            - adds the totals of the new tweets, counting only the authors not seen before the watermark
+            - recomputes the word distribution of the last chunk and appends the chunks of the new tweets,
+              so chunks have the boundaries a full scan would give them
+            - recomputes the rows of the hashtags the new tweets carry
+            - rescales the ratio columns of the other rows to the new totals
+        When a hashtag index covers the tweets before the scanned ones, the postings of the new tweets are added
+        to it, so the refreshed rows are fetched through the index with the new tweets.
+        The word divergence of untouched rows is kept, it is only exact after a full run.
+        Tweets are assumed to be inserted with increasing _ids and never deleted.
+    """
+    PROJECTION_PROFILES = ("hashtags", "corpus_text")
+
+    def __init__(self, dbHandler=None, featureExtractor=None, state_path="refresh_state.pickle", block_size=200,
+                 format="csv"):
+        """
+        :param format: FeatureSink format of the output, which is read back with IOHandler.readFeatures
+        """
+        super().__init__(dbHandler, featureExtractor)
+        self.state_path = state_path
+        self.block_size = block_size
+        self.format = format
+        self.hashtag_extractor = HashtagFeatureExtractor(featureExtractor=self)
+        self.tweet_extractor = TweetFeatureExtractor(featureExtractor=self)
+        self.index_fingerprint = None # fingerprint of the hashtag index while the refresh extends it
+        # the refreshed rows read their tweets as TweetRecords, converted once per block before they are cached
+        self.dbHandler.setTweetConverter(self.tweet_extractor.get_tweet_record)
+
+    def refresh(self, hashtags, output="features.csv"):
+        """
+            Brings the rows of the hashtags in output up to date. Without a refresh state, every row is computed
+            and the state is created.
+            :return: the hashtags whose rows were recomputed
+        """
+        state = self.load_state()
+        fingerprint = self.dbHandler.getCollectionFingerprint()
+        watermark = fingerprint[1]
+        if watermark is None:
+            return []
+        if state is not None and watermark == state["watermark"]:
+            return []
+
+        self.index_fingerprint = self.dbHandler.getHashtagIndexFingerprint()
+        if state is not None and self.index_fingerprint is not None and self.index_fingerprint[1] is not None \
+                and self.index_fingerprint[1] < state["last_chunk_start"]:
+            # the index misses tweets before the scanned ones, extending it would not make it complete
+            self.index_fingerprint = None
+
+        if state is None:
+            statistics, last_chunk_start = self.scan({"_id": {"$lte": watermark}})
+            touched = set(hashtags)
+        else:
+            statistics, last_chunk_start, touched = self.update(state, watermark)
+
+        if self.index_fingerprint is not None:
+            self.dbHandler.setHashtagIndexFingerprint(fingerprint)
+
+        old_statistics = state["statistics"] if state else statistics
+        self.tweet_extractor.set_corpus_statistics(statistics)
+
+        refreshed = [hashtag for hashtag in hashtags if hashtag in touched]
+        self.write_rows(hashtags, refreshed, old_statistics, statistics, output)
+        self.save_state({"watermark": watermark, "last_chunk_start": last_chunk_start, "statistics": statistics})
+
+        return refreshed
+
+    def scan(self, query):
+        """
+            Computes the corpus statistics of the tweets matching the query, as precalculateValues does
+            :return: the statistics and the _id of the first tweet of the last chunk
+        """
+        total_retweets, total_authors, total_urls, total_mentions = self.dbHandler.getTotalAttributes(query)
+        statistics = {
+            "total_tweets": 0,
+            "total_retweets": total_retweets,
+            "total_authors": total_authors,
+            "total_urls": total_urls,
+            "total_mentions": total_mentions,
+            "total_tweet_list": [],
+            "total_tweet_keys": [],
+        }
+        last_chunk_start, _ = self.add_chunks(statistics, query, None)
+
+        return statistics, last_chunk_start
+
+    def update(self, state, watermark):
+        """
+            Adds the tweets inserted after the state watermark, up to watermark, to the state statistics
+            :return: the statistics, the _id of the first tweet of the last chunk and the hashtags of the new tweets
+        """
+        statistics = dict(state["statistics"])
+        statistics["total_tweet_list"] = list(statistics["total_tweet_list"])
+        statistics["total_tweet_keys"] = list(statistics["total_tweet_keys"])
+
+        new_tweets = {"_id": {"$gt": state["watermark"], "$lte": watermark}}
+        total_retweets, _, total_urls, total_mentions = self.dbHandler.getTotalAttributes(new_tweets)
+        statistics["total_retweets"] += total_retweets
+        statistics["total_urls"] += total_urls
+        statistics["total_mentions"] += total_mentions
+
+        authors = self.dbHandler.getDistinctAuthors(new_tweets)
+        known_authors = self.dbHandler.getKnownAuthorCount(authors, {"_id": {"$lte": state["watermark"]}})
+        statistics["total_authors"] += len(authors) - known_authors
+
+        # the last chunk is rebuilt from its first tweet, so the new tweets fill it before starting new chunks
+        statistics["total_tweet_list"].pop()
+        statistics["total_tweet_keys"].pop()
+        chunks = {"_id": {"$gte": state["last_chunk_start"], "$lte": watermark}}
+        last_chunk_start, touched = self.add_chunks(statistics, chunks, state["watermark"])
+
+        return statistics, last_chunk_start, touched
+
+    def add_chunks(self, statistics, query, watermark):
+        """
+            Streams the tweets matching the query in chunks and appends their word distributions to the statistics.
+            Tweets after the watermark are counted in total_tweets and their hashtags are collected.
+            Tweets the hashtag index being extended does not hold yet get their postings added to it.
+            :return: the _id of the first tweet of the last chunk and the hashtags of the tweets after the watermark
+        """
+        last_chunk_start = None
+        touched = set()
+        projection = self.dbHandler.getProjection(["hashtags", "corpus_text"])
+        for tweets in self.dbHandler.streamTweets(self.CHUNK_SIZE, query=query, projection=projection):
+            text = " ".join(tweet["text"] for tweet in tweets)
+            tweet_keys, tweet_list = self.tweet_extractor.get_chunk_distribution(text)
+            statistics["total_tweet_keys"].append(tweet_keys)
+            statistics["total_tweet_list"].append(tweet_list)
+            last_chunk_start = tweets[0]["_id"]
+
+            postings = {}
+            for tweet in tweets:
+                if watermark is None or tweet["_id"] > watermark:
+                    statistics["total_tweets"] += 1
+                    # the hashtags of every path, as the hashtag queries and the index match them
+                    touched.update(self.dbHandler.getHashtagTexts(tweet))
+                if self.index_fingerprint is not None and (self.index_fingerprint[1] is None
+                                                           or tweet["_id"] > self.index_fingerprint[1]):
+                    for hashtag in self.dbHandler.getHashtagTexts(tweet):
+                        postings.setdefault(hashtag, []).append(tweet["_id"])
+
+            if postings:
+                self.dbHandler.addHashtagPostings(postings)
+
+        return last_chunk_start, touched
+
+    def write_rows(self, hashtags, refreshed, old_statistics, statistics, output):
+        """
+            Writes the rows of the hashtags to output, in the order of hashtags: refreshed hashtags get new rows,
+            the others keep their previous row with rescaled ratios. The output is replaced atomically.
+        """
+        rows = {}
+        if os.path.exists(output):
+            previous = IOHandler().readFeatures(output)
+            rows = {str(row["hashtag"]): get_typed_row(row) for row in previous.to_dict("records")}
+
+        scales = {}
+        for column, total in RATIO_TOTALS.items():
+            if old_statistics[total] and statistics[total]:
+                scales[column] = old_statistics[total] / statistics[total]
+
+        for row in rows.values():
+            for column, scale in scales.items():
+                row[column] *= scale
+
+        for start in range(0, len(refreshed), self.block_size):
+            block = refreshed[start:start + self.block_size]
+            block_tweets = self.dbHandler.getTweetsForHashtags(block)
+            for hashtag in block:
+                if not block_tweets[hashtag]:
+                    continue
+                row = {"hashtag": hashtag}
+                row.update(self.hashtag_extractor.get_hashtag_features(hashtag, block_tweets[hashtag]))
+                row.update(self.tweet_extractor.get_tweet_features(hashtag, block_tweets[hashtag]))
+                rows[hashtag] = row
+
+        temporary = output + ".tmp"
+        with FeatureSink(temporary, self.format, FEATURE_SCHEMA) as sink:
+            sink.write_rows(rows[hashtag] for hashtag in hashtags if hashtag in rows)
+        os.replace(temporary, output)
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, "rb") as state_file:
+            return pickle.load(state_file)
+
+    def save_state(self, state):
+        temporary = self.state_path + ".tmp"
+        with open(temporary, "wb") as state_file:
+            pickle.dump(state, state_file)
+        os.replace(temporary, self.state_path)
@@ -0,0 +1,166 @@
+from .FeatureExtractor import FeatureExtractor
+from .HashtagFeatureExtractor import HashtagFeatureExtractor
+from .TweetFeatureExtractor import TweetFeatureExtractor
+from .SentimentStore import SentimentStore
+from .CorpusStatisticsCache import CorpusStatisticsCache
+from .FeatureSink import FeatureSink, FEATURE_SCHEMA, get_typed_row
+from multiprocessing import Pool
+import csv
+import glob
+import os
+
+POSITION = "position" # shard column holding the row's position in hashtags.csv
+SHARD_SCHEMA = FEATURE_SCHEMA + ((POSITION, "int64"),)
+
+worker_state = {} # per process state, set by init_worker
+
+class ParallelFeatureExtractor:
+
+    """
+        Computes the feature rows of the hashtags on a process pool.
+        Hashtags are scheduled largest first, using the tweet count estimates of the db handler, so the few
+        popular hashtags that dominate the wall time start early instead of finishing last. Each worker keeps its own
+        db handler and the corpus statistics computed once by the parent and writes its own shard; shards are merged
+        in hashtags.csv order at the end.
+    """
+
+    def __init__(self, dbHandlerFactory, processes=None, block_size=200, sentimentStorePath=None,
+                 statisticsPath=None, format="csv"):
+        """
+        :param dbHandlerFactory: picklable callable creating a db handler, called once in every process
+        :param processes: number of worker processes. Defaults to the number of cores
+        :param block_size: maximum number of hashtags fetched together by a worker
+        :param sentimentStorePath: sentiment store shared by the workers. None scores sentiments without a store
+        :param statisticsPath: CorpusStatisticsCache file of the corpus statistics. None always computes them
+        :param format: FeatureSink format of the output. Shards are always csv
+        """
+        self.dbHandlerFactory = dbHandlerFactory
+        self.sentimentStorePath = sentimentStorePath
+        self.statisticsPath = statisticsPath
+        self.format = format
+        self.processes = processes or os.cpu_count()
+        self.block_size = block_size
+
+    def run(self, hashtags, output="features.csv"):
+        db_handler = self.dbHandlerFactory()
+        tweet_feature_extractor = TweetFeatureExtractor(db_handler)
+        tweet_feature_extractor.precalculateValues(CorpusStatisticsCache(self.statisticsPath)
+                                                   if self.statisticsPath else None)
+        statistics = tweet_feature_extractor.get_corpus_statistics()
+
+        tasks = self.schedule(hashtags, db_handler.getHashtagCountEstimates(hashtags))
+
+        for shard in glob.glob(self.get_shard_pattern(output)):
+            os.remove(shard)
+
+        shards = set()
+        from tqdm import tqdm
+        with Pool(self.processes, initializer=init_worker, initargs=(self.dbHandlerFactory, statistics, output,
+                                                                              self.sentimentStorePath)) as pool:
+            with tqdm(total=len(hashtags)) as progress:
+                for shard, done in pool.imap_unordered(extract_block, tasks):
+                    shards.add(shard)
+                    progress.update(done)
+
+        self.merge(sorted(shards), output)
+
+    def schedule(self, hashtags, estimates):
+        """
+            Splits the hashtags into blocks ordered from the largest to the smallest estimated tweet count.
+            Blocks are closed once they reach block_size hashtags or an even share of the estimated tweets,
+            so a popular hashtag gets a block of its own while rare ones are fetched together.
+            :return: list of blocks of (position, hashtag) tuples
+        """
+        positions = sorted(range(len(hashtags)), key=lambda position: -estimates.get(hashtags[position], 0))
+        target = max(1, sum(estimates.values()) // (self.processes * 4))
+
+        blocks = []
+        block = []
+        block_tweets = 0
+        for position in positions:
+            block.append((position, hashtags[position]))
+            block_tweets += estimates.get(hashtags[position], 0)
+            if len(block) == self.block_size or block_tweets >= target:
+                blocks.append(block)
+                block = []
+                block_tweets = 0
+        if block:
+            blocks.append(block)
+
+        return blocks
+
+    def merge(self, shards, output):
+        """
+            Writes the rows of all shards to output in their hashtags.csv order and removes the shards.
+            Csv rows are copied as text, so values are not re-parsed.
+        """
+        rows = []
+        header = None
+        for shard in shards:
+            with open(shard, newline="", encoding="utf-8") as csvfile:
+                reader = csv.DictReader(csvfile)
+                header = [label for label in reader.fieldnames if label != POSITION]
+                rows.extend(reader)
+
+        rows.sort(key=lambda row: int(row[POSITION]))
+
+        temporary = output + ".tmp"
+        if self.format == "csv":
+            with open(temporary, "w", newline="", encoding="utf-8") as csvfile:
+                if header:
+                    writer = csv.DictWriter(csvfile, fieldnames=header, extrasaction="ignore")
+                    writer.writeheader()
+                    writer.writerows(rows)
+        else:
+            with FeatureSink(temporary, self.format) as sink:
+                for row in rows:
+                    del row[POSITION]
+                    sink.write_row(get_typed_row(row))
+        os.replace(temporary, output)
+
+        for shard in shards:
+            os.remove(shard)
+
+    @staticmethod
+    def get_shard_pattern(output):
+        return output + ".shard-*"
+
+def init_worker(dbHandlerFactory, statistics, output, sentimentStorePath):
+    """
+        Creates the db handler and extractors a worker process reuses for all of its blocks
+    """
+    db_handler = dbHandlerFactory()
+    sentiment_store = SentimentStore(sentimentStorePath) if sentimentStorePath else None
+    feature_extractor = FeatureExtractor(db_handler, sentimentStore=sentiment_store)
+    tweet_feature_extractor = TweetFeatureExtractor(featureExtractor=feature_extractor)
+    tweet_feature_extractor.set_corpus_statistics(statistics)
+    # tweets are converted to TweetRecords once per block, before they are cached
+    db_handler.setTweetConverter(tweet_feature_extractor.get_tweet_record)
+
+    worker_state["db_handler"] = db_handler
+    worker_state["hashtag_feature_extractor"] = HashtagFeatureExtractor(featureExtractor=feature_extractor)
+    worker_state["tweet_feature_extractor"] = tweet_feature_extractor
+    worker_state["shard"] = FeatureSink(output + ".shard-{}".format(os.getpid()), schema=SHARD_SCHEMA)
+
+def extract_block(block):
+    """
+        Computes and writes the rows of a block of (position, hashtag) tuples to the shard of the worker
+        :return: the shard path and the number of hashtags processed
+    """
+    shard = worker_state["shard"]
+    hashtags = [hashtag for _, hashtag in block]
+    block_tweets = worker_state["db_handler"].getTweetsForHashtags(hashtags)
+
+    rows = []
+    for position, hashtag in block:
+        tweets = block_tweets[hashtag]
+        features = {POSITION: position, "hashtag": hashtag}
+        features.update(worker_state["hashtag_feature_extractor"].get_hashtag_features(hashtag, tweets))
+        features.update(worker_state["tweet_feature_extractor"].get_tweet_features(hashtag, tweets))
+        rows.append(features)
+
+    # the shard is read by the parent once the pool is done, so every block is flushed
+    shard.write_rows(rows)
+    shard.flush()
+
+    return shard.path, len(block)
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+
+class RunManifest:
+
+    """
+        Checkpoints a feature extraction run that writes its rows in the order of the hashtags.
+        Rows are appended to <output>.partial; after every checkpoint the manifest <output>.manifest.json records
+        the extractor version, the hashtag list, the number of completed hashtags and the size of the partial file
+        at that point. A resumed run truncates the rows written after the last checkpoint and skips the completed
+        hashtags. commit moves the partial file over the output in one atomic step, so the output is never a
+        half written or duplicated file.
+    """
+
+    def __init__(self, output, hashtags, version):
+        """
+        :param output: the CSV the run produces
+        :param hashtags: the hashtags of the run, in the order their rows are written
+        :param version: the extractor version, runs of another version are not resumed
+        """
+        self.output = output
+        self.partial_path = output + ".partial"
+        self.manifest_path = output + ".manifest.json"
+        self.version = version
+        self.hashtags_hash = hashlib.sha1("\n".join(hashtags).encode("utf-8")).hexdigest()
+        self.completed = 0
+
+    def begin(self, resume=True):
+        """
+            Prepares the partial file, resuming the previous run if its manifest matches this run
+            :return: the number of hashtags already completed, whose rows must not be written again
+        """
+        manifest = self.read() if resume else None
+        if manifest and manifest["version"] == self.version and manifest["hashtags"] == self.hashtags_hash \
+                and os.path.exists(self.partial_path) and os.path.getsize(self.partial_path) >= manifest["offset"]:
+            with open(self.partial_path, "r+b") as partial:
+                partial.truncate(manifest["offset"]) # drop the rows written after the last checkpoint
+            self.completed = manifest["completed"]
+        else:
+            open(self.partial_path, "wb").close()
+            self.completed = 0
+            self.checkpoint(0)
+
+        return self.completed
+
+    def checkpoint(self, completed):
+        """
+            Records that the rows of the first completed hashtags are durably written
+        """
+        with open(self.partial_path, "ab") as partial:
+            os.fsync(partial.fileno())
+
+        self.completed = completed
+        manifest = {
+            "version": self.version,
+            "hashtags": self.hashtags_hash,
+            "completed": completed,
+            "offset": os.path.getsize(self.partial_path),
+        }
+
+        temporary = self.manifest_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(temporary, self.manifest_path)
+
+    def commit(self):
+        """
+            Replaces the output with the completed partial file and removes the manifest
+        """
+        os.replace(self.partial_path, self.output)
+        os.remove(self.manifest_path)
+
+    def read(self):
+        """
+            :return: the manifest of the previous run, or None if there is none
+        """
+        if not os.path.exists(self.manifest_path):
+            return None
+
+        with open(self.manifest_path, encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
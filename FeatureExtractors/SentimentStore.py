@@ -0,0 +1,93 @@
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import numpy as np
+import hashlib
+import sqlite3
+
+class SentimentStore:
+
+    """
+        Persistent store of the 2/1/0 VADER sentiment class of tweets, backed by sqlite.
+        Sentiments are stored by tweet id and by a hash of the resolved tweet text, so a tweet is scored once per run
+        whatever the number of its hashtags, and retweets of an already scored text are not scored again.
+        Missing sentiments are scored lazily on read, or in bulk with populate.
+    """
+    SQLITE_MAX_VARIABLES = 900 # stays below the default sqlite limit of 999 bound parameters
+
+    def __init__(self, path="sentiments.sqlite"):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL") # parallel workers read while others write
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tweet_sentiments (tweet_id TEXT PRIMARY KEY, sentiment INTEGER)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS text_sentiments (text_hash TEXT PRIMARY KEY, sentiment INTEGER)")
+        self.connection.commit()
+        self.analyzer = None
+
+    def get_sentiments(self, tweets, featureExtractor):
+        """
+            Bulk read of the sentiments of the given tweets. Missing sentiments are scored and stored.
+            :param tweets: tweet json or TweetRecords
+            :param featureExtractor: resolves the tweet ids and texts and classifies their scores
+            :return: numpy array with the sentiment of every tweet, in the order of tweets
+        """
+        tweet_ids = [featureExtractor.get_tweet_id(tweet) for tweet in tweets]
+        sentiments = self.__select("tweet_sentiments", "tweet_id", tweet_ids)
+
+        missing = [tweet for tweet, tweet_id in zip(tweets, tweet_ids) if tweet_id not in sentiments]
+        if missing:
+            texts = [featureExtractor.get_tweet_text(tweet) for tweet in missing]
+            text_hashes = [self.get_text_hash(text) for text in texts]
+            text_sentiments = self.__select("text_sentiments", "text_hash", text_hashes)
+
+            new_texts = {}
+            for text, text_hash in zip(texts, text_hashes):
+                if text_hash not in text_sentiments:
+                    text_sentiments[text_hash] = featureExtractor.get_text_sentiment(self.get_analyzer(), text)
+                    new_texts[text_hash] = text_sentiments[text_hash]
+
+            new_tweets = {}
+            for tweet, text_hash in zip(missing, text_hashes):
+                tweet_id = featureExtractor.get_tweet_id(tweet)
+                sentiments[tweet_id] = new_tweets[tweet_id] = text_sentiments[text_hash]
+
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO text_sentiments VALUES (?, ?)", new_texts.items())
+                self.connection.executemany("INSERT OR REPLACE INTO tweet_sentiments VALUES (?, ?)", new_tweets.items())
+
+        return np.array([sentiments[tweet_id] for tweet_id in tweet_ids], dtype=np.int8)
+
+    def populate(self, dbHandler, featureExtractor, batch_size=10000):
+        """
+            Scores and stores the sentiment of every tweet of the collection in one pass
+        """
+        projection = dbHandler.getProjection(["text_features"])
+        from tqdm import tqdm
+        with tqdm(total=dbHandler.getNumOfTweets()) as progress:
+            for tweets in dbHandler.streamTweets(batch_size, projection=projection):
+                self.get_sentiments(tweets, featureExtractor)
+                progress.update(len(tweets))
+
+    def get_analyzer(self):
+        """
+            The analyzer loads its lexicon on creation, so a single one is created per store
+        """
+        if self.analyzer is None:
+            self.analyzer = SentimentIntensityAnalyzer()
+        return self.analyzer
+
+    def get_text_hash(self, text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def close(self):
+        self.connection.close()
+
+    def __select(self, table, key, values):
+        """
+            :return: dictionary of key -> sentiment of the stored values
+        """
+        found = {}
+        for start in range(0, len(values), self.SQLITE_MAX_VARIABLES):
+            batch = values[start:start + self.SQLITE_MAX_VARIABLES]
+            query = "SELECT {}, sentiment FROM {} WHERE {} IN ({})".format(key, table, key, ",".join("?" * len(batch)))
+            found.update(self.connection.execute(query, batch))
+
+        return found
@@ -0,0 +1,203 @@
+from .FeatureExtractor import FeatureExtractor
+from .HashtagFeatureExtractor import HashtagFeatureExtractor
+from .TweetFeatureExtractor import TweetFeatureExtractor
+from collections import Counter
+from datetime import datetime
+import time
+
+class HashtagAccumulator:
+
+    """
+        Running state of the features of one hashtag, updated once per tweet carrying it
+    """
+
+    def __init__(self):
+        self.popularity = 0
+        self.oldest = None # UTC epoch seconds of the TweetRecords
+        self.newest = None
+        self.cooccurances = 0
+        self.location_sum = 0
+        self.location_failed = False
+        self.sentiment_counts = Counter()
+        self.sentiment_first_seen = {} # sentiment -> index of its first tweet, breaks ties as most_common does
+        self.authors = set()
+        self.retweets = 0
+        self.urls = 0
+        self.mentions = 0
+        self.word_counts = Counter()
+
+class SinglePassFeatureExtractor(FeatureExtractor):
+
+    """
+        Computes the feature rows of every hashtag in one sequential scan of the collection.
+        Each tweet is parsed once and updates the accumulators of every hashtag it carries, so full extraction
+        costs one read of the data instead of one query per hashtag. Corpus totals and chunk word distributions
+        are gathered in the same scan. Rows have the columns createFeatureCSV writes.
+    """
+
+    def __init__(self, dbHandler=None, featureExtractor=None):
+        super().__init__(dbHandler, featureExtractor)
+        self.hashtag_extractor = HashtagFeatureExtractor(featureExtractor=self)
+        self.tweet_extractor = TweetFeatureExtractor(featureExtractor=self)
+
+    def get_features(self, hashtags=None):
+        """
+            :param hashtags: the hashtags to compute rows for. Defaults to every hashtag of the collection
+            :return: the feature rows, in the order of hashtags (or of first appearance). Hashtags without
+            tweets get no row.
+        """
+        if hashtags is None:
+            accumulators = {}
+        else:
+            accumulators = {hashtag: HashtagAccumulator() for hashtag in hashtags}
+
+        self.scan(accumulators, collect_all=hashtags is None)
+
+        accumulators = {hashtag: accumulator for hashtag, accumulator in accumulators.items() if accumulator.popularity}
+        divergences = self.tweet_extractor.get_divergences_for_freq_dicts(
+            [accumulator.word_counts for accumulator in accumulators.values()])
+
+        rows = []
+        for (hashtag, accumulator), divergence in zip(accumulators.items(), divergences):
+            rows.append(self.get_hashtag_row(hashtag, accumulator, divergence))
+
+        return rows
+
+    def scan(self, accumulators, collect_all=False):
+        """
+            Streams the collection once, updating the corpus totals and the accumulators of the hashtags of every tweet
+            :param collect_all: add an accumulator for every hashtag met, instead of only updating the given ones
+        """
+        extractor = self.tweet_extractor
+
+        extractor.total_tweets = 0
+        extractor.total_retweets = 0
+        extractor.total_urls = 0
+        extractor.total_mentions = 0
+        extractor.total_tweet_list = []
+        extractor.total_tweet_keys = []
+        extractor.word_divergence = None
+        authors = set()
+
+        projection = self.dbHandler.getProjection(["hashtag_features", "ratio_features", "text_features",
+                                                   "corpus_text"])
+        from tqdm import tqdm
+        with tqdm(total=self.dbHandler.getNumOfTweets()) as progress:
+            for tweets in self.dbHandler.streamTweets(self.CHUNK_SIZE, projection=projection):
+                targeted = [] # (record, its hashtags, its accumulators) of the tweets carrying wanted hashtags
+                for tweet, record in zip(tweets, extractor.get_tweet_records(tweets)):
+                    extractor.total_retweets += record.is_retweet
+                    extractor.total_urls += record.has_url
+                    extractor.total_mentions += record.has_mention
+                    authors.add(record.author)
+
+                    # a tweet belongs to the hashtags of all its hashtag paths, as in the $or queries and the
+                    # hashtag index the other extraction modes fetch the tweets of a hashtag with
+                    member_hashtags = self.dbHandler.getHashtagTexts(tweet)
+                    if collect_all:
+                        targets = [(hashtag, accumulators.setdefault(hashtag, HashtagAccumulator()))
+                                   for hashtag in member_hashtags]
+                    else:
+                        targets = [(hashtag, accumulators[hashtag]) for hashtag in member_hashtags
+                                   if hashtag in accumulators]
+                    if targets:
+                        targeted.append((record, self.get_hashtags_from_tweet(record), targets))
+
+                sentiments = self.get_batch_sentiments([tweet for tweet, _, _ in targeted])
+                for (tweet, tweet_hashtags, targets), sentiment in zip(targeted, sentiments):
+                    self.accumulate(tweet, tweet_hashtags, targets, sentiment)
+
+                text = " ".join(tweet["text"] for tweet in tweets)
+                tweet_keys, tweet_list = extractor.get_chunk_distribution(text)
+                extractor.total_tweet_keys.append(tweet_keys)
+                extractor.total_tweet_list.append(tweet_list)
+
+                extractor.total_tweets += len(tweets)
+                progress.update(len(tweets))
+
+        extractor.total_authors = len(authors)
+
+    def get_batch_sentiments(self, tweets):
+        """
+            returns the sentiments of a batch of tweets, with one bulk read when a sentiment store is used
+        """
+        if self.sentimentStore:
+            return self.sentimentStore.get_sentiments(tweets, self).tolist()
+
+        analyzer = self.get_analyzer()
+        return [self.get_text_sentiment(analyzer, self.get_tweet_text(tweet)) for tweet in tweets]
+
+    def accumulate(self, tweet, tweet_hashtags, targets, sentiment):
+        """
+            Updates the accumulators of the hashtags of a TweetRecord. The per tweet work is done once, for all of them.
+            :param tweet_hashtags: the resolved hashtags of the record, the co-occurrence counter reads them
+            as HashtagFeatureExtractor.get_hashtags_cooccurance does
+        """
+        extractor = self.tweet_extractor
+        author = tweet.author
+        is_retweet = tweet.is_retweet
+        contains_urls = tweet.has_url
+        contains_mentions = tweet.has_mention
+
+        text = tweet.text
+        positions, word_count = self.hashtag_extractor.get_locator().get_positions(text)
+        word_counts = extractor.textToFreqDict(self.get_sanitized_text(text))
+        created_at = tweet.created_at
+
+        for hashtag, accumulator in targets:
+            if accumulator.oldest is None or created_at < accumulator.oldest:
+                accumulator.oldest = created_at
+            if accumulator.newest is None or created_at > accumulator.newest:
+                accumulator.newest = created_at
+
+            if len(tweet_hashtags) > 1:
+                accumulator.cooccurances += 1
+
+            if hashtag in positions:
+                accumulator.location_sum += positions[hashtag] / word_count
+            else:
+                accumulator.location_failed = True
+
+            accumulator.sentiment_counts[sentiment] += 1
+            accumulator.sentiment_first_seen.setdefault(sentiment, accumulator.popularity)
+
+            accumulator.authors.add(author)
+            accumulator.retweets += is_retweet
+            accumulator.urls += contains_urls
+            accumulator.mentions += contains_mentions
+            accumulator.word_counts.update(word_counts)
+
+            accumulator.popularity += 1
+
+    def get_hashtag_row(self, hashtag, accumulator, divergence=None):
+        """
+            Converts the accumulator of a hashtag to its feature row, with the same values and column order
+            as HashtagFeatureExtractor.get_hashtag_features and TweetFeatureExtractor.get_tweet_features give for
+            the tweets of DbHandler.getTweetsForHashtag, which match the hashtag on any of its hashtag paths
+            :param divergence: the word divergence of the hashtag if already computed in a batch
+        """
+        extractor = self.tweet_extractor
+        popularity = accumulator.popularity
+
+        self.hashtag_extractor.hashtag = hashtag
+        features = {"hashtag": hashtag}
+        features.update(self.hashtag_extractor.get_hashtag_text_features())
+
+        features["cooccurance"] = self.hashtag_extractor.get_cooccurance_flag(accumulator.cooccurances, popularity)
+        features["location"] = -1 if accumulator.location_failed else accumulator.location_sum / popularity
+        features["hashtag_sentiment"] = max(accumulator.sentiment_counts, key=lambda sentiment: (
+            accumulator.sentiment_counts[sentiment], -accumulator.sentiment_first_seen[sentiment]))
+        features["popularity"] = popularity
+        features["created_at"] = time.mktime(datetime.utcfromtimestamp(accumulator.oldest).timetuple())
+        features["lifespan"] = float(accumulator.newest - accumulator.oldest)
+
+        features["tweet_ratio"] = popularity / extractor.total_tweets
+        features["author_ratio"] = len(accumulator.authors) / extractor.total_authors
+        features["retweet_ratio"] = accumulator.retweets / extractor.total_retweets
+        features["mention_ratio"] = accumulator.mentions / extractor.total_mentions
+        features["url_ratio"] = accumulator.urls / extractor.total_urls
+        if divergence is None:
+            divergence = extractor.get_divergence_for_freq_dict(accumulator.word_counts)
+        features["word_divergence_distribution"] = divergence
+
+        return features
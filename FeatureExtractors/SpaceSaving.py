@@ -0,0 +1,74 @@
+import heapq
+
+class SpaceSaving:
+
+    """
+        Space-Saving heavy hitters sketch: approximate counts of the most frequent items of a stream in the
+        memory of capacity counters.
+        When a new item arrives and all counters are taken, it replaces the item with the smallest count and
+        inherits that count as its error. Every monitored item then satisfies
+            count - error <= true count <= count
+        every error is at most total / capacity, and any item seen more than total / capacity times is monitored.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {} # monitored item -> count
+        self.errors = {} # monitored item -> overestimation bound of its count
+        self.__heap = [] # (count, item) entries, stale when count differs from counts[item]
+
+    def add(self, item):
+        self.total += 1
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+        elif len(counts) < self.capacity:
+            counts[item] = 1
+            self.errors[item] = 0
+        else:
+            minimum, evicted = self.__popMinimum()
+            del counts[evicted]
+            del self.errors[evicted]
+            counts[item] = minimum + 1
+            self.errors[item] = minimum
+
+        heapq.heappush(self.__heap, (counts[item], item))
+        if len(self.__heap) > 4 * self.capacity:
+            self.__rebuildHeap()
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def get_top_k(self, k):
+        """
+            :return: list of the k items with the largest counts, as (item, count, error) tuples
+        """
+        top = heapq.nlargest(k, self.counts.items(), key=lambda entry: entry[1])
+        return [(item, count, self.errors[item]) for item, count in top]
+
+    def get_guaranteed_top_k(self, k):
+        """
+            :return: the items of get_top_k whose lower bound reaches the (k + 1)th largest count, so they are
+            certainly among the k most frequent items
+        """
+        top = self.get_top_k(k + 1)
+        threshold = top[k][1] if len(top) > k else 0
+        return [item for item, count, error in top[:k] if count - error >= threshold]
+
+    def get_error_bound(self):
+        """
+            :return: the largest possible overestimation of any count
+        """
+        return self.total // self.capacity
+
+    def __popMinimum(self):
+        while True:
+            count, item = heapq.heappop(self.__heap)
+            if self.counts.get(item) == count:
+                return count, item
+
+    def __rebuildHeap(self):
+        self.__heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self.__heap)
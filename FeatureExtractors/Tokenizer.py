@@ -0,0 +1,56 @@
+from nltk.stem.porter import PorterStemmer
+from nltk.stem import WordNetLemmatizer
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+from collections import Counter, OrderedDict
+
+class Tokenizer:
+
+    """
+        Tokenizes texts into word frequency dictionaries, the way TweetFeatureExtractor.textToFreqDict always did:
+        stopwords are removed, then words are stemmed, lemmatized and lowercased.
+        The normalized form of every distinct token is memoized in a bounded LRU table, so stemming and
+        lemmatization run once per distinct token instead of once per occurrence.
+    """
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self.stemmer = PorterStemmer()
+        self.lemmatizer = WordNetLemmatizer()
+        self.stop_words = set(stopwords.words('english'))
+        self.__memo = OrderedDict() # token -> normalized form, None for stopwords
+
+    def get_freq_dict(self, text):
+        """
+            :return: Counter of the normalized words of the text
+        """
+        counts = Counter()
+        for token in word_tokenize(text):
+            word = self.normalize(token)
+            if word is not None:
+                counts[word] += 1
+
+        return counts
+
+    def normalize(self, token):
+        """
+            :return: the stemmed, lemmatized and lowercased token, or None if it is a stopword
+        """
+        memo = self.__memo
+        if token in memo:
+            memo.move_to_end(token)
+            return memo[token]
+
+        if token in self.stop_words:
+            word = None
+        else:
+            word = self.lemmatizer.lemmatize(self.stemmer.stem(token)).lower()
+
+        memo[token] = word
+        if len(memo) > self.max_entries:
+            memo.popitem(last=False)
+
+        return word
+
+    def clear(self):
+        self.__memo.clear()
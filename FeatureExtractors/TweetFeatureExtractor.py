@@ -1,31 +1,89 @@
 from FeatureExtractors.FeatureExtractor import FeatureExtractor
-import numpy as np
-import LDA
-from nltk.stem.porter import PorterStemmer
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from FeatureExtractors.Tokenizer import Tokenizer
+from FeatureExtractors.WordDivergence import WordDivergence
+from FeatureExtractors.TweetRecord import TweetRecord
 
 class TweetFeatureExtractor(FeatureExtractor):
 
-    def precalculateValues(self):
+    PROJECTION_PROFILES = ("ratio_features", "text_features")
+
+    tokenizer = None # tokenizer shared by all extractors, so its memo table lasts the whole run
+    word_divergence = None # WordDivergence of the corpus chunks, built on first use
+    topic_model = None # LDA.TopicModel of the corpus, the topic feature is only computed when it is set
+
+    def precalculateValues(self, statisticsCache=None):
+        """
+            :param statisticsCache: CorpusStatisticsCache the values are loaded from while the collection is unchanged,
+            and saved to when they are computed
+        """
+        if statisticsCache:
+            fingerprint = self.dbHandler.getCollectionFingerprint()
+            statistics = statisticsCache.load(fingerprint)
+            if statistics is not None:
+                print("Loaded total attributes from", statisticsCache.path)
+                self.set_corpus_statistics(statistics)
+                return
+
         self.total_tweets = self.dbHandler.getNumOfTweets()
         print("Extracting total attributes")
         self.total_retweets, self.total_authors, self.total_urls, self.total_mentions, self.total_tweet_list, self.total_tweet_keys = self.get_total_attributes()
+        self.word_divergence = None
 
+        if statisticsCache:
+            self.get_word_divergence_engine() # saved with the statistics
+            statisticsCache.save(self.get_corpus_statistics(), fingerprint)
 
-    def get_tweet_features(self, hashtag):
+    def get_corpus_statistics(self):
+        """
+            returns the values computed by precalculateValues, so other extractors or processes can reuse them
+        """
+        return {
+            "total_tweets": self.total_tweets,
+            "total_retweets": self.total_retweets,
+            "total_authors": self.total_authors,
+            "total_urls": self.total_urls,
+            "total_mentions": self.total_mentions,
+            "total_tweet_list": self.total_tweet_list,
+            "total_tweet_keys": self.total_tweet_keys,
+            "word_divergence": self.word_divergence,
+        }
+
+    def set_corpus_statistics(self, statistics):
+        """
+            uses values returned by get_corpus_statistics instead of running precalculateValues.
+            The chunk lists can be None when the statistics carry their word divergence engine, as cached ones do
+        """
+        for name, value in statistics.items():
+            setattr(self, name, value)
+        self.word_divergence = statistics.get("word_divergence")
+
+    def get_chunk_distribution(self, text):
+        """
+            returns the word keys and word probabilities of a corpus chunk text
+        """
+        tweet_dict = self.textToFreqDict(text)
+        tweet_keys = list(tweet_dict.keys())
+        tweet_list = [value / len(tweet_dict) for value in tweet_dict.values()]
+
+        return tweet_keys, tweet_list
+
+
+    def get_tweet_features(self, hashtag, tweets=None):
         """
             stores the tweet related features
+            :param tweets: the tweets of the hashtag if already fetched, e.g. by DbHandler.getTweetsForHashtags
         """
         self.hashtag = hashtag
-        self.tweets = self.dbHandler.getTweetsForHashtag(self.hashtag)
+        if tweets is None:
+            tweets = self.dbHandler.getTweetsForHashtag(self.hashtag)
+        self.tweets = tweets
 
         tweet_features = {}
         #sentiment feature for tweet
         #tweet_features["tweet_sentiment"] = self.get_tweets_sentiment()
         # topic feature
-        # tweet_features["topic"] = self.__get_topic()
+        if self.topic_model is not None:
+            tweet_features["topic"] = self.get_topic()
         #ratio features
         tweet_features["tweet_ratio"] = self.get_tweet_ratio()
         tweet_features["author_ratio"] = self.get_author_ratio()
@@ -37,48 +95,44 @@ class TweetFeatureExtractor(FeatureExtractor):
 
         return tweet_features
 
+    def get_tweet_record(self, tweet):
+        """
+            Converts one tweet json to a TweetRecord, e.g. as the tweet converter of a db handler
+        """
+        return tweet if isinstance(tweet, TweetRecord) else TweetRecord.fromTweet(tweet, self)
+
+    def get_tweet_records(self, tweets, keep_raw=False):
+        """
+            Normalizes tweet json to TweetRecords once, so the features of a hashtag stop walking the json
+            :param keep_raw: keep the tweet json in the records
+        """
+        return [tweet if isinstance(tweet, TweetRecord) else TweetRecord.fromTweet(tweet, self, keep_raw)
+                for tweet in tweets]
+
     def get_total_attributes(self):
         """
         Calculate 4 attributes for all tweets in database.
         Attributes: total number of retweets, urls, mentions and authors
         They will be used as denominators in specific ratio extractions
+        The counts are aggregated on the server. Only the tweet texts are streamed, to build the word
+        frequency distribution of every chunk of the corpus.
         """
-        total_retweets = 0
-        total_urls = 0
-        total_mentions = 0
-
-        chunk_size = self.CHUNK_SIZE
-        skip = 0
+        total_retweets, total_authors, total_urls, total_mentions = self.dbHandler.getTotalAttributes()
 
-        authors = set()
         total_tweet_list = []
         total_tweet_keys = []
+        projection = self.dbHandler.getProjection(["corpus_text"])
         from tqdm import tqdm
-        for _ in tqdm(range(0, self.total_tweets, chunk_size)):
-            tweets = self.dbHandler.getTweetsByNum(chunk_size, skip=skip)
-            for tweet in tweets:
-                if self.is_retweet(tweet):
-                    total_retweets += 1
-                if self.contains_mentions(tweet):
-                    total_urls += 1
-                if self.contains_mentions(tweet):
-                    total_mentions += 1
-
-                authors.add(self.get_author(tweet))
-
-            text = self.dbHandler.getTweetTexts(chunk_size, skip=skip)
-
-            tweet_dict = self.textToFreqDict(text)
-            tweet_keys = list(tweet_dict.keys())
-            tweet_list = [value / len(tweet_dict) for value in tweet_dict.values()]  # () creates generator for ram efficiency
-            total_tweet_keys.append(tweet_keys)
-            total_tweet_list.append(tweet_list)
-
-            skip += chunk_size
-
-        total_authors = len(authors)
+        with tqdm(total=self.total_tweets) as progress:
+            for tweets in self.dbHandler.streamTweets(self.CHUNK_SIZE, projection=projection):
+                # same chunk text that getTweetTexts would return, without a second query
+                text = " ".join(tweet["text"] for tweet in tweets)
 
+                tweet_keys, tweet_list = self.get_chunk_distribution(text)
+                total_tweet_keys.append(tweet_keys)
+                total_tweet_list.append(tweet_list)
 
+                progress.update(len(tweets))
 
         return total_retweets, total_authors, total_urls, total_mentions, total_tweet_list, total_tweet_keys
 
@@ -86,9 +140,7 @@ class TweetFeatureExtractor(FeatureExtractor):
         """
             returns the ratio of tweets containing the specific hashtag
         """
-        total_tweets = self.dbHandler.getNumOfTweets()
-
-        return len(self.tweets) / total_tweets
+        return len(self.tweets) / self.total_tweets
 
     def get_author_ratio(self):
         """
@@ -105,6 +157,8 @@ class TweetFeatureExtractor(FeatureExtractor):
         """
             returns the author of the specific tweet
         """
+        if isinstance(tweet, TweetRecord):
+            return tweet.author
         return tweet["user"]["id_str"]
 
     def get_retweet_ratio(self):
@@ -122,6 +176,8 @@ class TweetFeatureExtractor(FeatureExtractor):
         """
             returns true if tweet json contains retweeted status field which means that this is a retweet
         """
+        if isinstance(tweet, TweetRecord):
+            return tweet.is_retweet
         return "retweeted_status" in tweet
 
     def get_word_divergence(self):
@@ -130,34 +186,33 @@ class TweetFeatureExtractor(FeatureExtractor):
             Clarity is computed as the Kullback-Leibler word divergence distribution
         """
         # create hashtag text
-        hashtag_text = ""
-        for tweet in self.tweets:
-            text = self.get_tweet_text(tweet)
-            text = self.get_sanitized_text(text)
-            text += " "
-            hashtag_text += text
+        hashtag_text = " ".join(self.get_sanitized_text(self.get_tweet_text(tweet)) for tweet in self.tweets)
 
         hashtag_word_dict = self.textToFreqDict(hashtag_text)
 
-        hashtag_clarity = []
-        for tweet_list, tweet_keys in zip(self.total_tweet_list, self.total_tweet_keys):
-            divergence = self.get_divergence_for_chunk(tweet_list, tweet_keys, hashtag_word_dict)
-            hashtag_clarity.append(divergence)
-
-        return np.asarray(hashtag_clarity).mean()
-
-    def get_divergence_for_chunk(self, tweetList, tweetKeys, hashtag_word_dict):
-        word_list = (hashtag_word_dict[key] / len(hashtag_word_dict) if key in hashtag_word_dict.keys() else 0 for key in tweetKeys)
-        return self.KL(word_list, tweetList)
+        return self.get_divergence_for_freq_dict(hashtag_word_dict)
 
-    def KL(self, a, b):
+    def get_divergence_for_freq_dict(self, hashtag_word_dict):
+        """
+            Mean Kullback-Leibler divergence of a hashtag word frequency dictionary from the corpus chunks
+        """
+        return self.get_word_divergence_engine().get_mean_divergence(hashtag_word_dict)
 
-        summary = 0
-        for x, y in zip(a, b):
-            if x != 0:
-                summary += x * np.log(x/y)
+    def get_divergences_for_freq_dicts(self, hashtag_word_dicts):
+        """
+            Batch version of get_divergence_for_freq_dict, computed as one sparse matrix product
+            :return: list of the mean divergences, in the order of hashtag_word_dicts
+        """
+        return self.get_word_divergence_engine().get_mean_divergences(hashtag_word_dicts).tolist()
 
-        return summary#np.sum(np.where(a != 0, a * np.log(a / b), 0))
+    def get_word_divergence_engine(self):
+        """
+            returns the sparse matrices of the corpus chunk distributions, built once from total_tweet_keys and
+            total_tweet_list
+        """
+        if self.word_divergence is None:
+            self.word_divergence = WordDivergence(self.total_tweet_keys, self.total_tweet_list)
+        return self.word_divergence
 
     def textToFreqDict(self, text):
         """
@@ -168,51 +223,22 @@ class TweetFeatureExtractor(FeatureExtractor):
         :param text:
         :return: word frequency dictionary
         """
-        stemmer = PorterStemmer()
-        wordnet_lemmatizer = WordNetLemmatizer()
-        wordlist = word_tokenize(text)
+        return self.get_tokenizer().get_freq_dict(text)
 
-        stop_words = set(stopwords.words('english'))
-
-        wordlist = [word for word in wordlist if not word in stop_words]
-        wordlist = [stemmer.stem(word) for word in wordlist]
-        wordlist = [wordnet_lemmatizer.lemmatize(word) for word in wordlist]
-        wordlist = [word.lower() for word in wordlist]
-
-        unique, counts = np.unique(wordlist, return_counts=True)
-        return dict(zip(unique, counts))
-
-    def __get_topic(self):
+    def get_tokenizer(self):
         """
-            returns a dictionary of (hashtag: topic) attributes using Latent Dirichlet Allocation
+            returns the shared tokenizer, created on first use since it loads the stopword list
         """
-        tweet_topic = {}
-        tweet_data = []
-        for tweet in self.tweets:
-            tweet_topic[tweet["id_str"]] = ""
-
-            text = self.get_tweet_text(tweet)
-            tweet_data.append((text, tweet["id_str"]))
-
-        lda = LDA.LDA(tweet_data)
+        if TweetFeatureExtractor.tokenizer is None:
+            TweetFeatureExtractor.tokenizer = Tokenizer()
+        return TweetFeatureExtractor.tokenizer
 
-        for tweet in self.tweets:
-            text = self.get_tweet_text(tweet)
-            tweet_topic[tweet["id_str"]] = lda.predict_with_bag(text)
-            # tweet_topic[tweet["id_str"]] = lda.predict_with_tf_idf(text)
-
-        hashtag_topic = {}
-        for hashtag in self.hashtags:
-            hashtag_topic[hashtag["text"]] = []
-
-        for tweet, hashtagList in self.tweet_hashtag_map.items():
-            for hashtag in hashtagList:
-                hashtag_topic[hashtag["text"]].append(tweet_topic[tweet])
-
-        #hashtag topic is the the topic of the majority of hashtag's tweets
-        hashtag_topic = {hashtag: self.most_common(l) for hashtag, l in
-                             hashtag_topic.items()}
-        return hashtag_topic
+    def get_topic(self):
+        """
+            returns the topic of the majority of the hashtag's tweets, from the corpus topic model
+        """
+        texts = (self.get_tweet_text(tweet) for tweet in self.tweets)
+        return self.topic_model.get_hashtag_topic(self.hashtag, texts)
 
     def get_url_ratio(self):
         """
@@ -229,6 +255,8 @@ class TweetFeatureExtractor(FeatureExtractor):
         """
             returns true if tweet json contains at least one url
         """
+        if isinstance(tweet, TweetRecord):
+            return tweet.has_url
         return self.contains_entities_element(tweet, "urls")
 
     def get_mention_ratio(self):
@@ -246,6 +274,8 @@ class TweetFeatureExtractor(FeatureExtractor):
         """
             returns true if tweet json contains at least one mention
         """
+        if isinstance(tweet, TweetRecord):
+            return tweet.has_mention
         return self.contains_entities_element(tweet, "user_mentions")
 
     def contains_entities_element(self, tweet, element):
@@ -0,0 +1,43 @@
+from datetime import datetime
+import calendar
+import sys
+
+class TweetRecord:
+
+    """
+        Compact, normalized form of a tweet json.
+        The truncated / extended / retweeted cases of the tweet are resolved once, when the record is created,
+        so features read plain attributes instead of walking the nested json again for every feature.
+            id: the tweet id_str
+            created_at: creation time as UTC epoch seconds
+            author: the user id_str
+            is_retweet, has_url, has_mention: the flags of TweetFeatureExtractor
+            text: the resolved text of FeatureExtractor.get_tweet_text
+            hashtags: tuple of the interned hashtags of FeatureExtractor.get_hashtags_from_tweet
+            raw: the tweet json, or None when it is dropped
+    """
+    __slots__ = ("id", "created_at", "author", "is_retweet", "has_url", "has_mention", "text", "hashtags", "raw")
+
+    @classmethod
+    def fromTweet(cls, tweet, tweetFeatureExtractor, keep_raw=False):
+        """
+            :param tweetFeatureExtractor: resolves the tweet fields the way the features always did
+            :param keep_raw: keep the tweet json in the record, for code that still needs other fields
+        """
+        record = cls()
+        record.id = tweet["id_str"]
+        record.created_at = calendar.timegm(tweet["created_at"].timetuple())
+        record.author = tweetFeatureExtractor.get_author(tweet)
+        record.is_retweet = tweetFeatureExtractor.is_retweet(tweet)
+        record.has_url = bool(tweetFeatureExtractor.contains_urls(tweet))
+        record.has_mention = bool(tweetFeatureExtractor.contains_mentions(tweet))
+        record.text = tweetFeatureExtractor.get_tweet_text(tweet)
+        record.hashtags = tuple(sys.intern(hashtag) for hashtag in tweetFeatureExtractor.get_hashtags_from_tweet(tweet))
+        record.raw = tweet if keep_raw else None
+        return record
+
+    def get_datetime(self):
+        """
+            :return: created_at as the naive UTC datetime stored in MongoDB
+        """
+        return datetime.utcfromtimestamp(self.created_at)
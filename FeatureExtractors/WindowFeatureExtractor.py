@@ -0,0 +1,205 @@
+from .FeatureExtractor import FeatureExtractor
+from .HashtagFeatureExtractor import HashtagFeatureExtractor
+from .TweetFeatureExtractor import TweetFeatureExtractor
+from collections import Counter, deque
+from datetime import timedelta
+import time
+
+class WindowTweet:
+
+    """
+        The values of a tweet the window features need, kept until the tweet leaves the window
+    """
+    __slots__ = ("created_at", "author", "is_retweet", "contains_urls", "contains_mentions", "hashtags",
+                 "cooccurs", "ratios", "sentiment", "word_counts")
+
+class WindowHashtagState:
+
+    """
+        Running state of the features of one hashtag over the tweets of the window that carry it.
+        Every count can be decremented, so tweets leaving the window are removed exactly.
+    """
+
+    def __init__(self):
+        self.created_at = deque() # creation times of the hashtag tweets, oldest first
+        self.sentiments = deque() # sentiments of the hashtag tweets, oldest first
+        self.cooccurances = 0
+        self.location_sum = 0
+        self.location_failures = 0
+        self.authors = Counter()
+        self.retweets = 0
+        self.urls = 0
+        self.mentions = 0
+        self.word_counts = Counter()
+
+    def update(self, tweet, ratio, sign):
+        """
+            Adds (sign 1) or removes (sign -1) a tweet carrying the hashtag
+        """
+        if sign > 0:
+            self.created_at.append(tweet.created_at)
+            self.sentiments.append(tweet.sentiment)
+        else:
+            self.created_at.popleft()
+            self.sentiments.popleft()
+
+        self.cooccurances += sign * tweet.cooccurs
+        if ratio is None:
+            self.location_failures += sign
+        else:
+            self.location_sum += sign * ratio
+        self.retweets += sign * tweet.is_retweet
+        self.urls += sign * tweet.contains_urls
+        self.mentions += sign * tweet.contains_mentions
+
+        update_counter(self.authors, {tweet.author: 1}, sign)
+        update_counter(self.word_counts, tweet.word_counts, sign)
+
+class WindowFeatureExtractor(FeatureExtractor):
+
+    """
+        Feature rows of the hashtags of a tweet stream, over a sliding time window.
+        Tweets are added as they arrive and leave the window once it has moved window_seconds past them, so
+        memory is bounded by the number of tweets in the window. Rows have the columns createFeatureCSV writes:
+        popularity, lifespan and the ratios are measured on the tweets of the window, and word divergence is
+        measured against the corpus statistics of the tweet feature extractor.
+        Tweets are assumed to arrive in created_at order, as the streaming API delivers them.
+    """
+
+    def __init__(self, dbHandler=None, featureExtractor=None, window_seconds=3600, corpusStatistics=None):
+        """
+        :param corpusStatistics: TweetFeatureExtractor.get_corpus_statistics of the training corpus, used for
+        the word divergence
+        """
+        super().__init__(dbHandler, featureExtractor)
+        self.window = timedelta(seconds=window_seconds)
+        self.hashtag_extractor = HashtagFeatureExtractor(featureExtractor=self)
+        self.tweet_extractor = TweetFeatureExtractor(featureExtractor=self)
+        if corpusStatistics:
+            self.tweet_extractor.set_corpus_statistics(corpusStatistics)
+
+        self.window_tweets = deque()
+        self.states = {} # hashtag -> WindowHashtagState of the hashtags in the window
+        self.total_tweets = 0
+        self.total_retweets = 0
+        self.total_urls = 0
+        self.total_mentions = 0
+        self.authors = Counter()
+
+    def add_tweet(self, tweet):
+        """
+            Adds a tweet to the window and drops the tweets the window has moved past
+            :return: the hashtags of the tweet
+        """
+        window_tweet = self.get_window_tweet(tweet)
+        self.window_tweets.append(window_tweet)
+        self.update(window_tweet, 1)
+        self.expire(window_tweet.created_at)
+
+        return list(window_tweet.hashtags)
+
+    def expire(self, now):
+        """
+            Drops the tweets the window has moved past at time now, also while no tweet arrives
+            :param now: naive UTC datetime of the stream
+            :return: the hashtags of the dropped tweets
+        """
+        hashtags = set()
+        expired = now - self.window
+        while self.window_tweets and self.window_tweets[0].created_at <= expired:
+            window_tweet = self.window_tweets.popleft()
+            self.update(window_tweet, -1)
+            hashtags.update(window_tweet.hashtags)
+
+        return hashtags
+
+    def get_window_tweet(self, tweet):
+        """
+            Computes the per tweet values once, for all hashtags of the tweet
+        """
+        extractor = self.tweet_extractor
+        window_tweet = WindowTweet()
+        window_tweet.created_at = tweet["created_at"]
+        window_tweet.author = extractor.get_author(tweet)
+        window_tweet.is_retweet = extractor.is_retweet(tweet)
+        window_tweet.contains_urls = bool(extractor.contains_urls(tweet))
+        window_tweet.contains_mentions = bool(extractor.contains_mentions(tweet))
+
+        tweet_hashtags = self.get_hashtags_from_tweet(tweet)
+        window_tweet.hashtags = set(tweet_hashtags)
+        window_tweet.cooccurs = len(tweet_hashtags) > 1
+
+        text = self.get_tweet_text(tweet)
+        positions, word_count = self.hashtag_extractor.get_locator().get_positions(text)
+        window_tweet.ratios = {hashtag: positions[hashtag] / word_count if hashtag in positions else None
+                               for hashtag in window_tweet.hashtags}
+        window_tweet.sentiment = self.get_text_sentiment(self.get_analyzer(), text)
+        window_tweet.word_counts = extractor.textToFreqDict(self.get_sanitized_text(text))
+
+        return window_tweet
+
+    def update(self, window_tweet, sign):
+        """
+            Adds (sign 1) or removes (sign -1) a tweet from the window totals and the states of its hashtags
+        """
+        self.total_tweets += sign
+        self.total_retweets += sign * window_tweet.is_retweet
+        self.total_urls += sign * window_tweet.contains_urls
+        self.total_mentions += sign * window_tweet.contains_mentions
+        update_counter(self.authors, {window_tweet.author: 1}, sign)
+
+        for hashtag in window_tweet.hashtags:
+            state = self.states.get(hashtag)
+            if state is None:
+                state = self.states[hashtag] = WindowHashtagState()
+            state.update(window_tweet, window_tweet.ratios[hashtag], sign)
+            if not state.created_at:
+                del self.states[hashtag]
+
+    def get_hashtag_row(self, hashtag):
+        """
+            :return: the feature row of a hashtag of the window, or None if the window has no tweet carrying it
+        """
+        state = self.states.get(hashtag)
+        if state is None:
+            return None
+        popularity = len(state.created_at)
+
+        self.hashtag_extractor.hashtag = hashtag
+        features = {"hashtag": hashtag}
+        features.update(self.hashtag_extractor.get_hashtag_text_features())
+
+        features["cooccurance"] = self.hashtag_extractor.get_cooccurance_flag(state.cooccurances, popularity)
+        features["location"] = -1 if state.location_failures else state.location_sum / popularity
+        # ties break toward the earliest tweet of the window, as in the offline features
+        features["hashtag_sentiment"] = self.most_common(state.sentiments)
+        features["popularity"] = popularity
+        features["created_at"] = time.mktime(state.created_at[0].timetuple())
+        features["lifespan"] = (state.created_at[-1] - state.created_at[0]).total_seconds()
+
+        features["tweet_ratio"] = get_ratio(popularity, self.total_tweets)
+        features["author_ratio"] = get_ratio(len(state.authors), len(self.authors))
+        features["retweet_ratio"] = get_ratio(state.retweets, self.total_retweets)
+        features["mention_ratio"] = get_ratio(state.mentions, self.total_mentions)
+        features["url_ratio"] = get_ratio(state.urls, self.total_urls)
+        features["word_divergence_distribution"] = self.tweet_extractor.get_divergence_for_freq_dict(
+            state.word_counts)
+
+        return features
+
+def update_counter(counter, counts, sign):
+    """
+        Adds or subtracts counts from counter, dropping the keys that reach zero so the counter stays bounded
+    """
+    for key, count in counts.items():
+        value = counter[key] + sign * count
+        if value:
+            counter[key] = value
+        else:
+            del counter[key]
+
+def get_ratio(part, total):
+    """
+        ratio of a window total, 0 while the window has none of the counted tweets
+    """
+    return part / total if total else 0
@@ -0,0 +1,115 @@
+from scipy import sparse
+import numpy as np
+
+class WordDivergence:
+
+    """
+        Kullback-Leibler word divergence of hashtags from the corpus chunks, over a shared vocabulary.
+        The chunk word distributions are stored once as sparse chunk x vocabulary matrices:
+            presence: 1 where the chunk contains the word
+            log_probabilities: log of the chunk word probability
+        For a hashtag word distribution h the divergence from every chunk, summed over the chunk words, is
+            KL = presence @ (h * log h) - log_probabilities @ h
+        where a hashtag word probability is its count over the number of distinct hashtag words, and words
+        missing from a chunk add nothing to its divergence.
+        Many hashtags are handled at once as a sparse hashtag x vocabulary matrix.
+        get_arrays and fromArrays convert the engine to and from plain arrays, for CorpusStatisticsCache.
+    """
+
+    def __init__(self, total_tweet_keys, total_tweet_list):
+        """
+        :param total_tweet_keys: the word keys of every corpus chunk
+        :param total_tweet_list: the word probabilities of every corpus chunk, in the order of its keys
+        """
+        self.vocabulary = {}
+        columns = []
+        indptr = [0]
+        for tweet_keys in total_tweet_keys:
+            columns.extend(self.vocabulary.setdefault(key, len(self.vocabulary)) for key in tweet_keys)
+            indptr.append(len(columns))
+
+        probabilities = np.fromiter((value for tweet_list in total_tweet_list for value in tweet_list),
+                                    dtype=np.float64, count=len(columns))
+        self.set_matrices(np.asarray(columns, dtype=np.int64), np.asarray(indptr, dtype=np.int64),
+                          np.log(probabilities))
+
+    @classmethod
+    def fromArrays(cls, words, columns, indptr, log_probabilities):
+        """
+            Creates the engine from the arrays of get_arrays, without going through the chunk lists
+        """
+        word_divergence = cls.__new__(cls)
+        word_divergence.vocabulary = {word: index for index, word in enumerate(words)}
+        word_divergence.set_matrices(columns, indptr, log_probabilities)
+        return word_divergence
+
+    def get_arrays(self):
+        """
+            :return: the vocabulary words in column order and the indices, indptr and data of log_probabilities
+        """
+        return (list(self.vocabulary), self.log_probabilities.indices, self.log_probabilities.indptr,
+                self.log_probabilities.data)
+
+    def set_matrices(self, columns, indptr, log_probabilities):
+        shape = (len(indptr) - 1, len(self.vocabulary))
+        self.presence = sparse.csr_matrix((np.ones(len(columns)), columns, indptr), shape=shape)
+        self.log_probabilities = sparse.csr_matrix((log_probabilities, columns, indptr), shape=shape)
+
+        # the mean over the chunks only needs the column sums
+        self.chunk_counts = np.asarray(self.presence.sum(axis=0)).ravel()
+        self.log_probability_sums = np.asarray(self.log_probabilities.sum(axis=0)).ravel()
+
+    def get_chunk_divergences(self, hashtag_word_dicts):
+        """
+            :param hashtag_word_dicts: word frequency dictionaries of the hashtags
+            :return: hashtags x chunks array of the divergence of every hashtag from every chunk
+        """
+        probabilities = self.get_probability_matrix(hashtag_word_dicts)
+        entropy_terms = probabilities.multiply(self.__log(probabilities))
+
+        divergences = entropy_terms @ self.presence.T - probabilities @ self.log_probabilities.T
+        return divergences.toarray()
+
+    def get_mean_divergences(self, hashtag_word_dicts):
+        """
+            :return: array of the mean divergence of every hashtag from the corpus chunks
+        """
+        if not self.presence.shape[0]:
+            return np.full(len(hashtag_word_dicts), np.nan)
+
+        probabilities = self.get_probability_matrix(hashtag_word_dicts)
+        entropy_terms = probabilities.multiply(self.__log(probabilities)).tocsr()
+
+        divergences = entropy_terms @ self.chunk_counts - probabilities @ self.log_probability_sums
+        return divergences / self.presence.shape[0]
+
+    def get_mean_divergence(self, hashtag_word_dict):
+        return self.get_mean_divergences([hashtag_word_dict])[0]
+
+    def get_probability_matrix(self, hashtag_word_dicts):
+        """
+            :return: sparse hashtags x vocabulary matrix of the word probabilities of the hashtags.
+            Probabilities are normalized by the number of distinct words of the hashtag.
+            Words outside the corpus vocabulary are dropped, since the divergence only sums over chunk words.
+        """
+        columns = []
+        values = []
+        indptr = [0]
+        for hashtag_word_dict in hashtag_word_dicts:
+            distinct_words = len(hashtag_word_dict)
+            for word, count in hashtag_word_dict.items():
+                if word in self.vocabulary:
+                    columns.append(self.vocabulary[word])
+                    values.append(count / distinct_words)
+            indptr.append(len(columns))
+
+        return sparse.csr_matrix((np.asarray(values, dtype=np.float64), np.asarray(columns, dtype=np.int64), indptr),
+                                 shape=(len(hashtag_word_dicts), len(self.vocabulary)))
+
+    def __log(self, matrix):
+        """
+            :return: sparse matrix of the log of the stored values of a csr matrix
+        """
+        logarithms = matrix.copy()
+        logarithms.data = np.log(logarithms.data)
+        return logarithms
@@ -6,9 +6,59 @@ from gensim.utils import simple_preprocess
 from gensim.parsing.preprocessing import STOPWORDS
 from nltk.stem import WordNetLemmatizer, SnowballStemmer
 from nltk.stem.porter import *
+from collections import Counter
+import functools
+import itertools
 import pandas as pd
 import numpy as np
 import nltk
+import json
+import os
+import re
+
+URL_PATTERN = re.compile(r'\w+:\/{2}[\d\w-]+(\.[\d\w-]+)*(?:(?:\/[^\s/]*))*')
+
+lemmatizer = None # WordNetLemmatizer shared by the models, created once wordnet is available
+stemmer = SnowballStemmer('english')
+
+def download_wordnet():
+    """
+        Downloads the wordnet corpus the lemmatizer needs, only if it is not installed yet
+    """
+    try:
+        nltk.data.find('corpora/wordnet')
+    except LookupError:
+        nltk.download('wordnet')
+
+def preprocess(text):
+    """
+        Removes potential URLs
+        Tokenizes given text into sentences and words.
+        Lowercase and punctuation removed.
+        Words smaller than 3 characters removed.
+        Stopwords removed.
+        Lemmatize words.
+        Stem words.
+    """
+    result = []
+
+    text = URL_PATTERN.sub('', text)
+    for token in simple_preprocess(text):
+        if token not in STOPWORDS and len(token) > 3:
+            result.append(lemmatize_stemming(token))
+
+    return result
+
+@functools.lru_cache(maxsize=200000)
+def lemmatize_stemming(text):
+    """
+        Lemmatizes and stems english words. Memoized, as the same words recur across the tweets
+    """
+    global lemmatizer
+    if lemmatizer is None:
+        download_wordnet()
+        lemmatizer = WordNetLemmatizer()
+    return stemmer.stem(lemmatizer.lemmatize(text, pos='v'))
 
 class LDA:
 
@@ -17,12 +67,10 @@ class LDA:
     __TOKENS_TO_KEEP = 100000
 
     def __init__(self, data):
-        nltk.download('wordnet')
         np.random.seed(2018)
         labels = ["text", "id"]
         self.__documents = pd.DataFrame.from_records(data, columns=labels)
-        self.__stemmer = SnowballStemmer('english')
-        self.__processed_docs = self.__documents["text"].map(self.__preprocess)
+        self.__processed_docs = self.__documents["text"].map(preprocess)
         self.__bow_corpus = self.__filter_out_words()
 
         self.__lda_bag_model = self.__lda_with_bag_of_words()
@@ -32,7 +80,7 @@ class LDA:
         """
             predict the topic of a tweet using lda bag of words model
         """
-        bow_vector = self.__dictionary.doc2bow(self.__preprocess(tweetText))
+        bow_vector = self.__dictionary.doc2bow(preprocess(tweetText))
         prediction = sorted(self.__lda_bag_model[bow_vector], key=lambda tup: -1 * tup[1])
 
         index, score = prediction[0]
@@ -43,7 +91,7 @@ class LDA:
         """
             predict the topic of a tweet using lda tf idf model
         """
-        bow_vector = self.__dictionary.doc2bow(self.__preprocess(tweetText))
+        bow_vector = self.__dictionary.doc2bow(preprocess(tweetText))
         prediction = sorted(self.__lda_tf_model[bow_vector], key=lambda tup: -1 * tup[1])
 
         index, score = prediction[0]
@@ -84,28 +132,148 @@ class LDA:
         bow_corpus = [self.__dictionary.doc2bow(document) for document in self.__processed_docs]  # contains (word_id,times_appeard) tuples
         return bow_corpus
 
-    def __preprocess(self, text):
+class TopicModel:
+
+    """
+        Corpus wide LDA topic model, trained once over the whole collection and saved with its dictionary:
+            <path>: the gensim LdaMulticore bag of words model
+            <path>.dictionary: the gensim Dictionary of the corpus
+            <path>.hashtags.json: hashtag -> its most common tweet topic, the lookup table of the topic feature
+        Tweets are assigned topics in batches, with one inference call per batch instead of one per tweet.
+        Topics are the ids of the most probable topic of a tweet, -1 for tweets without known words.
+    """
+    MINIMUM_DOCUMENT_APPEARANCES = 0
+    MAXIMUM_DOCUMENT_APPEARANCE_FRACTION = 1
+    TOKENS_TO_KEEP = 100000
+    NO_TOPIC = -1
+
+    def __init__(self, model, dictionary, hashtag_topics=None):
+        self.model = model
+        self.dictionary = dictionary
+        self.hashtag_topics = hashtag_topics or {}
+
+    @classmethod
+    def train(cls, dbHandler, featureExtractor, path="topic_model.lda", num_topics=20, passes=2, workers=2):
         """
-            Removes potential URLs
-            Tokenizes given text into sentences and words. 
-            Lowercase and punctuation removed.
-            Words smaller than 3 characters removed.
-            Stopwords removed.
-            Lemmatize words.
-            Stem words.
+            Trains the model on every tweet of the collection and builds the hashtag lookup table.
+            The collection is scanned once: the processed tweets are spooled to <path>.tokens and the bag of words
+            corpus is serialized to <path>.mm, which the model passes and the table are read from. Both are removed
+            once the table is built.
+            The table counts a tweet for the hashtags of all its hashtag paths, as DbHandler.getHashtagTexts reads
+            them, so its hashtags have the tweets the feature rows are built from.
+            :param featureExtractor: resolves the tweet texts
         """
-        result = []
+        tokens_path = path + ".tokens"
+        corpus_path = path + ".mm"
+
+        dictionary = corpora.Dictionary()
+        projection = dbHandler.getProjection(["hashtags", "text_features"])
+        from tqdm import tqdm
+        with open(tokens_path, "w", encoding="utf-8") as tokens_file:
+            with tqdm(total=dbHandler.getNumOfTweets()) as progress:
+                for tweets in dbHandler.streamTweets(featureExtractor.CHUNK_SIZE, projection=projection):
+                    documents = [preprocess(featureExtractor.get_tweet_text(tweet)) for tweet in tweets]
+                    dictionary.add_documents(documents)
+                    for tweet, document in zip(tweets, documents):
+                        # hashtags and stemmed tokens are single words, so they are space separated
+                        tokens_file.write("{}\t{}\n".format(" ".join(sorted(dbHandler.getHashtagTexts(tweet))),
+                                                            " ".join(document)))
+                    progress.update(len(tweets))
 
-        text = re.sub(r'\w+:\/{2}[\d\w-]+(\.[\d\w-]+)*(?:(?:\/[^\s/]*))*', '', text)
-        for token in simple_preprocess(text):
-            if token not in STOPWORDS and len(token) > 3:
-                result.append(self.__lemmatize_stemming(token))
-        
-        return result
+        dictionary.filter_extremes(no_below=cls.MINIMUM_DOCUMENT_APPEARANCES,
+                                   no_above=cls.MAXIMUM_DOCUMENT_APPEARANCE_FRACTION, keep_n=cls.TOKENS_TO_KEEP)
+        corpora.MmCorpus.serialize(corpus_path, (dictionary.doc2bow(document)
+                                                 for _, document in read_tokens(tokens_path)))
+        corpus = corpora.MmCorpus(corpus_path)
 
-    def __lemmatize_stemming(self, text):
+        model = models.LdaMulticore(corpus, num_topics=num_topics, id2word=dictionary, passes=passes,
+                                    workers=workers, random_state=2018)
+        topic_model = cls(model, dictionary)
+
+        hashtag_counts = {}
+        hashtags = (tweet_hashtags for tweet_hashtags, _ in read_tokens(tokens_path))
+        documents = iter(corpus)
+        while True:
+            batch = list(itertools.islice(documents, featureExtractor.CHUNK_SIZE))
+            if not batch:
+                break
+            for topic, tweet_hashtags in zip(topic_model.get_bow_topics(batch), hashtags):
+                for hashtag in tweet_hashtags:
+                    hashtag_counts.setdefault(hashtag, Counter())[topic] += 1
+        topic_model.hashtag_topics = {hashtag: get_topic_majority(counts) for hashtag, counts in hashtag_counts.items()}
+
+        os.remove(tokens_path)
+        os.remove(corpus_path)
+        os.remove(corpus_path + ".index")
+        return topic_model
+
+    @classmethod
+    def load(cls, path="topic_model.lda"):
         """
-            Lemmatizes and stems english words
+            :return: the saved model, or None if it has not been trained yet
         """
-        return self.__stemmer.stem(WordNetLemmatizer().lemmatize(text, pos='v'))
- 
\ No newline at end of file
+        if not os.path.exists(path + ".hashtags.json"):
+            return None
+
+        model = models.LdaMulticore.load(path)
+        dictionary = corpora.Dictionary.load(path + ".dictionary")
+        with open(path + ".hashtags.json", encoding="utf-8") as hashtags_file:
+            hashtag_topics = json.load(hashtags_file)
+        return cls(model, dictionary, hashtag_topics)
+
+    def save(self, path="topic_model.lda"):
+        self.model.save(path)
+        self.dictionary.save(path + ".dictionary")
+        # the lookup table is written last, load checks for it
+        with open(path + ".hashtags.json", "w", encoding="utf-8") as hashtags_file:
+            json.dump(self.hashtag_topics, hashtags_file)
+
+    def get_topics(self, texts):
+        """
+            :return: the topic of every text, inferred in one batch
+        """
+        return self.get_bow_topics([self.dictionary.doc2bow(preprocess(text)) for text in texts])
+
+    def get_bow_topics(self, documents):
+        """
+            :return: the topic of every bag of words document, inferred in one batch
+        """
+        if not documents:
+            return []
+
+        gamma, _ = self.model.inference(documents)
+        topics = np.argmax(gamma, axis=1).tolist()
+        return [topic if document else self.NO_TOPIC for topic, document in zip(topics, documents)]
+
+    def get_hashtag_topic(self, hashtag, texts=()):
+        """
+            :return: the topic of the majority of the hashtag's tweets, from the lookup table.
+            Hashtags the model was not trained on are inferred from the texts of their tweets.
+        """
+        if hashtag in self.hashtag_topics:
+            return self.hashtag_topics[hashtag]
+        return get_topic_majority(Counter(self.get_topics(texts)))
+
+    def get_topic_words(self, topic, words=5):
+        """
+            :return: the most probable words of a topic, as predict_with_bag printed them
+        """
+        return self.model.print_topic(topic, words)
+
+def read_tokens(tokens_path):
+    """
+        :return: generator of (hashtags, tokens) of the tweets spooled by TopicModel.train
+    """
+    with open(tokens_path, encoding="utf-8") as tokens_file:
+        for line in tokens_file:
+            hashtags, tokens = line.rstrip("\n").split("\t")
+            yield hashtags.split(), tokens.split()
+
+def get_topic_majority(counts):
+    """
+        :return: the most common topic of a Counter of topics, ignoring tweets without a topic
+    """
+    counts = Counter({topic: count for topic, count in counts.items() if topic != TopicModel.NO_TOPIC})
+    if not counts:
+        return TopicModel.NO_TOPIC
+    return counts.most_common(1)[0][0]
@@ -8,6 +8,7 @@ class PlotFactory:
 
     def __init__(self, dbHandler, data):
         self.dbHandler = dbHandler
+        self.dbHandler.addProjectionProfiles(["time_series"])
         self.data = data
         self.hashtags = self.data["hashtag"].values
 
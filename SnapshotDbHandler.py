@@ -0,0 +1,280 @@
+from TweetCache import TweetCache
+import pyarrow as pa
+import numpy as np
+import os
+
+class SnapshotDbHandler:
+
+    """
+        DbHandler compatible reader over an offline columnar snapshot of the tweet collection.
+        The snapshot directory holds two Arrow IPC files that are memory mapped on open:
+            tweets.arrow: one normalized row per tweet, sorted by created_at
+            hashtags.arrow: one row per hashtag with the tweet rows it appears in
+        Tweets are returned as minimal tweet json, so the extractors and PlotFactory read them unchanged.
+        Rows keep the raw top level text next to the resolved one, for the corpus chunks, and the hashtags of
+        all hashtag paths next to the resolved ones, so a hashtag has the tweets DbHandler would return for it.
+        Snapshots are read only and do not support queries, so the hashtag index and incremental refreshes
+        need the MongoDB collection.
+    """
+    TWEETS_FILE = "tweets.arrow"
+    HASHTAGS_FILE = "hashtags.arrow"
+    SCHEMA = pa.schema([
+        ("id", pa.string()),
+        ("created_at", pa.timestamp("ms")),
+        ("author", pa.string()),
+        ("is_retweet", pa.bool_()),
+        ("has_url", pa.bool_()),
+        ("has_mention", pa.bool_()),
+        ("text", pa.string()),
+        ("hashtags", pa.list_(pa.string())),
+        ("raw_text", pa.string()), # the top level text, as the corpus_text projection reads it
+        ("hashtag_texts", pa.list_(pa.string())), # the hashtags of all hashtag paths, as DbHandler.getHashtagTexts
+    ])
+    PROJECTION_PROFILES = {} # columns are already projected, kept for DbHandler compatibility
+    HASHTAG_PATHS = ("entities.hashtags.text", "extended_tweet.entities.hashtags.text",
+                     "retweeted_status.entities.hashtags.text", "retweeted_status.extended_tweet.entities.hashtags.text")
+
+    def __init__(self, path="snapshot", cache_size=500000):
+        self.path = path
+        self.tweet_cache = TweetCache(cache_size)
+        self.tweets = self.__readTable(self.TWEETS_FILE)
+        if self.tweets.schema.names != self.SCHEMA.names:
+            raise ValueError("The snapshot at {} was exported by an older version, export it again".format(path))
+
+        hashtags = self.__readTable(self.HASHTAGS_FILE)
+        self.hashtag_rows = hashtags.column("rows")
+        self.hashtag_positions = {hashtag: position for position, hashtag in
+                                  enumerate(hashtags.column("hashtag").to_pylist())}
+
+        # created_at is sorted, so date ranges are resolved with a binary search
+        self.created_at = self.tweets.column("created_at").to_numpy().astype("datetime64[ms]").astype(np.int64)
+        self.id_rows = None
+        self.tweet_converter = None
+
+    @staticmethod
+    def exportSnapshot(dbHandler, tweetFeatureExtractor, path="snapshot", batch_size=10000):
+        """
+            Streams the tweet collection once and writes it as a snapshot that SnapshotDbHandler can read.
+            :param tweetFeatureExtractor: resolves texts, hashtags and entities the same way feature extraction does
+        """
+        os.makedirs(path, exist_ok=True)
+
+        projection = dbHandler.getProjection(["hashtag_features", "ratio_features", "text_features", "corpus_text"])
+        batches = []
+        from tqdm import tqdm
+        with tqdm(total=dbHandler.getNumOfTweets()) as progress:
+            for tweets in dbHandler.streamTweets(batch_size, projection=projection):
+                columns = {name: [] for name in SnapshotDbHandler.SCHEMA.names}
+                for tweet in tweets:
+                    columns["id"].append(tweet["id_str"])
+                    columns["created_at"].append(tweet["created_at"])
+                    columns["author"].append(tweetFeatureExtractor.get_author(tweet))
+                    columns["is_retweet"].append(tweetFeatureExtractor.is_retweet(tweet))
+                    columns["has_url"].append(bool(tweetFeatureExtractor.contains_urls(tweet)))
+                    columns["has_mention"].append(bool(tweetFeatureExtractor.contains_mentions(tweet)))
+                    columns["text"].append(tweetFeatureExtractor.get_tweet_text(tweet))
+                    columns["hashtags"].append(tweetFeatureExtractor.get_hashtags_from_tweet(tweet))
+                    columns["raw_text"].append(tweet["text"])
+                    columns["hashtag_texts"].append(sorted(dbHandler.getHashtagTexts(tweet)))
+
+                arrays = [pa.array(columns[field.name], type=field.type) for field in SnapshotDbHandler.SCHEMA]
+                batches.append(pa.RecordBatch.from_arrays(arrays, names=SnapshotDbHandler.SCHEMA.names))
+                progress.update(len(tweets))
+
+        table = pa.Table.from_batches(batches, schema=SnapshotDbHandler.SCHEMA)
+        created_at = table.column("created_at").to_numpy().astype("datetime64[ms]").astype(np.int64)
+        table = table.take(pa.array(np.argsort(created_at, kind="stable")))
+
+        postings = {}
+        for row, hashtags in enumerate(table.column("hashtag_texts").to_pylist()):
+            for hashtag in hashtags:
+                postings.setdefault(hashtag, []).append(row)
+        hashtags = pa.Table.from_arrays([pa.array(list(postings.keys()), type=pa.string()),
+                                         pa.array(list(postings.values()), type=pa.list_(pa.int64()))],
+                                        names=["hashtag", "rows"])
+
+        SnapshotDbHandler.__writeTable(table, os.path.join(path, SnapshotDbHandler.TWEETS_FILE))
+        SnapshotDbHandler.__writeTable(hashtags, os.path.join(path, SnapshotDbHandler.HASHTAGS_FILE))
+
+    def addProjectionProfiles(self, profiles):
+        pass
+
+    def getProjection(self, profiles=None):
+        return None
+
+    def ensureIndexes(self, db=None):
+        pass
+
+    def getNumOfTweets(self, db=None):
+        return self.tweets.num_rows
+
+    def getCollectionFingerprint(self, db=None):
+        """
+            :return: (number of tweets, modification time of the snapshot), snapshots are only changed by exports
+        """
+        return self.tweets.num_rows, os.path.getmtime(os.path.join(self.path, self.TWEETS_FILE))
+
+    def getTweets(self, db=None):
+        return self.__toTweets(self.tweets)
+
+    def getTweetsByNum(self, num, skip=None, db=None):
+        return self.__toTweets(self.tweets.slice(skip or 0, num))
+
+    def streamTweets(self, batch_size, query=None, projection=None, db=None):
+        """
+            Yields all tweets in lists of batch_size, in snapshot order. Queries are not supported.
+        """
+        if query:
+            raise NotImplementedError("Snapshots do not support queries, use a MongoDB data source")
+
+        for start in range(0, self.tweets.num_rows, batch_size):
+            yield self.__toTweets(self.tweets.slice(start, batch_size))
+
+    def getTweetById(self, id, db=None):
+        if self.id_rows is None:
+            self.id_rows = {tweet_id: row for row, tweet_id in enumerate(self.tweets.column("id").to_pylist())}
+
+        if id not in self.id_rows:
+            return None
+        return self.__toTweets(self.tweets.slice(self.id_rows[id], 1))[0]
+
+    def setTweetConverter(self, converter):
+        """
+            Converts the tweets of hashtag lookups once, before they are cached, as DbHandler.setTweetConverter does
+        """
+        self.tweet_converter = converter
+        self.tweet_cache.clear()
+
+    def getTweetsForHashtag(self, hashtag="India", db=None, since=None, until=None):
+        """
+            Whole hashtags, without a date range, are served from the tweet cache
+            :param since: only tweets created at or after this datetime
+            :param until: only tweets created before this datetime
+        """
+        return self.getTweetsForHashtags([hashtag], since=since, until=until)[hashtag]
+
+    def getTweetsForHashtags(self, hashtags, db=None, since=None, until=None):
+        """
+            The rows of the hashtags missing from the cache are decoded and converted once per block, so a tweet
+            carrying several hashtags of the block is shared by their lists
+        """
+        cacheable = since is None and until is None
+        hashtag_tweets = {hashtag: self.tweet_cache.get(hashtag) if cacheable else None for hashtag in hashtags}
+
+        hashtag_rows = {}
+        for hashtag, tweets in hashtag_tweets.items():
+            if tweets is None:
+                rows = self.__getHashtagRows(hashtag)
+                hashtag_rows[hashtag] = rows[self.__getDateMask(rows, since, until)]
+        if not hashtag_rows:
+            return hashtag_tweets
+
+        block_rows = np.unique(np.concatenate(list(hashtag_rows.values())))
+        tweets = self.__toTweets(self.tweets.take(pa.array(block_rows)))
+        if self.tweet_converter is not None:
+            tweets = [self.tweet_converter(tweet) for tweet in tweets]
+
+        for hashtag, rows in hashtag_rows.items():
+            # block_rows is sorted, so the position of every row of the hashtag is found with a binary search
+            hashtag_tweets[hashtag] = [tweets[position] for position in np.searchsorted(block_rows, rows).tolist()]
+            if cacheable:
+                self.tweet_cache.put(hashtag, hashtag_tweets[hashtag])
+        return hashtag_tweets
+
+    def getHashtagTexts(self, tweet):
+        """
+            :return: the set of hashtags of the snapshot tweet, as DbHandler.getHashtagTexts reads a tweet json
+        """
+        texts = set()
+        for path in self.HASHTAG_PATHS:
+            node = tweet
+            for key in path.split(".")[:-1]: # walk down to the hashtags array
+                node = node.get(key) if isinstance(node, dict) else None
+            if node:
+                texts.update(hashtag["text"] for hashtag in node)
+
+        return texts
+
+    def getHashtagCountEstimates(self, hashtags, db=None):
+        return {hashtag: len(self.__getHashtagRows(hashtag)) for hashtag in hashtags}
+
+    def getTweetsBetween(self, since=None, until=None, db=None):
+        """
+            Returns the tweets created in [since, until). Only the matching slice of the snapshot is decoded.
+        """
+        start, end = self.__getDateRange(since, until)
+        return self.__toTweets(self.tweets.slice(start, end - start))
+
+    def getTotalAttributes(self, query=None, db=None):
+        """
+            Same totals as DbHandler.getTotalAttributes, computed on the snapshot columns
+        """
+        if query:
+            raise NotImplementedError("Snapshots do not support queries, use a MongoDB data source")
+
+        total_retweets = int(np.count_nonzero(self.tweets.column("is_retweet").to_numpy()))
+        total_authors = len(set(self.tweets.column("author").to_pylist()))
+        total_urls = int(np.count_nonzero(self.tweets.column("has_url").to_numpy()))
+        total_mentions = int(np.count_nonzero(self.tweets.column("has_mention").to_numpy()))
+
+        return total_retweets, total_authors, total_urls, total_mentions
+
+    def __getHashtagRows(self, hashtag):
+        if hashtag not in self.hashtag_positions:
+            return np.array([], dtype=np.int64)
+        return np.asarray(self.hashtag_rows[self.hashtag_positions[hashtag]].as_py(), dtype=np.int64)
+
+    def __getDateRange(self, since, until):
+        """
+            :return: the [start, end) snapshot rows of the tweets created in [since, until)
+        """
+        start, end = 0, self.tweets.num_rows
+        if since is not None:
+            start = int(np.searchsorted(self.created_at, self.__toMillis(since), side="left"))
+        if until is not None:
+            end = int(np.searchsorted(self.created_at, self.__toMillis(until), side="left"))
+        return start, max(start, end)
+
+    def __getDateMask(self, rows, since, until):
+        start, end = self.__getDateRange(since, until)
+        return (rows >= start) & (rows < end)
+
+    def __toMillis(self, date):
+        return np.datetime64(date, "ms").astype(np.int64)
+
+    def __toTweets(self, table):
+        """
+            Converts snapshot rows to the minimal tweet json the extractors read
+        """
+        columns = table.to_pydict()
+        tweets = []
+        for (id_str, created_at, author, is_retweet, has_url, has_mention, text, hashtags, raw_text,
+             hashtag_texts) in zip(*(columns[name] for name in self.SCHEMA.names)):
+            entities = {
+                "hashtags": [{"text": hashtag} for hashtag in hashtags],
+                "urls": [{}] if has_url else [],
+                "user_mentions": [{}] if has_mention else [],
+            }
+            # get_tweet_text reads the resolved text from extended_tweet, getHashtagTexts adds its hashtags
+            # to the resolved ones, while entities and truncated keep get_hashtags_from_tweet resolved
+            extended_tweet = {"full_text": text,
+                              "entities": {"hashtags": [{"text": hashtag} for hashtag in hashtag_texts]}}
+            tweet = {"_id": id_str, "id_str": id_str, "created_at": created_at, "user": {"id_str": author},
+                     "truncated": False, "retweeted": is_retweet, "text": raw_text, "entities": entities,
+                     "extended_tweet": extended_tweet}
+            if is_retweet:
+                tweet["retweeted_status"] = {"truncated": False, "text": text, "entities": entities}
+            tweets.append(tweet)
+
+        return tweets
+
+    def __readTable(self, file):
+        source = pa.memory_map(os.path.join(self.path, file), "r")
+        return pa.ipc.open_file(source).read_all()
+
+    @staticmethod
+    def __writeTable(table, file):
+        with pa.OSFile(file, "wb") as sink:
+            writer = pa.ipc.new_file(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
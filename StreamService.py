@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import socket
+import json
+import time
+
+TWITTER_DATE_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+class JsonlTweetSource:
+
+    """
+        Tweets of a file with one tweet json per line, as the streaming API writes them.
+        With follow, the file is tailed like a live stream instead of ending at its last line, and None is
+        yielded every poll_interval seconds without a new tweet, so the consumer keeps running on a quiet stream.
+    """
+
+    def __init__(self, path, follow=False, poll_interval=1.0):
+        self.path = path
+        self.follow = follow
+        self.poll_interval = poll_interval
+
+    def __iter__(self):
+        with open(self.path, "rb") as tweets:
+            while True:
+                line = tweets.readline()
+                if not line.endswith(b"\n") and self.follow:
+                    # wait for the writer to finish the line
+                    time.sleep(self.poll_interval)
+                    tweets.seek(-len(line), 1)
+                    yield None
+                    continue
+                if not line:
+                    return
+
+                tweet = parse_tweet(line.decode("utf-8"))
+                if tweet:
+                    yield tweet
+
+class SocketTweetSource:
+
+    """
+        Tweets read as json lines from a TCP socket, a local stand-in for the Twitter stream.
+        None is yielded every poll_interval seconds without data, as JsonlTweetSource does.
+    """
+
+    def __init__(self, host="localhost", port=9999, poll_interval=1.0):
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+
+    def __iter__(self):
+        with socket.create_connection((self.host, self.port)) as connection:
+            connection.settimeout(self.poll_interval)
+            pending = b""
+            while True:
+                try:
+                    data = connection.recv(65536)
+                except socket.timeout:
+                    yield None
+                    continue
+                if not data:
+                    break
+
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop() # the unfinished last line
+                for line in lines:
+                    tweet = parse_tweet(line.decode("utf-8"))
+                    if tweet:
+                        yield tweet
+
+            tweet = parse_tweet(pending.decode("utf-8"))
+            if tweet:
+                yield tweet
+
+def parse_tweet(line):
+    """
+        :return: the tweet json of a stream line with created_at as a naive UTC datetime, as stored in MongoDB,
+        or None for blank lines and stream messages that are not tweets, such as delete notices
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    tweet = json.loads(line)
+    if "created_at" not in tweet or "text" not in tweet:
+        return None
+
+    if isinstance(tweet["created_at"], str):
+        created_at = datetime.strptime(tweet["created_at"], TWITTER_DATE_FORMAT)
+        tweet["created_at"] = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return tweet
+
+class PopularityModel:
+
+    """
+        Classifier of hashtag feature rows into the popularity buckets of the predictors' extractLabels.
+        The buckets are cut from the popularity, so popularity and tweet_ratio, which is proportional to it, are
+        not used as inputs: the classifier would only learn the bucket thresholds of the window count.
+    """
+    LABEL_COLUMNS = ["popularity", "tweet_ratio"] # the columns the labels are derived from
+
+    def __init__(self, train, predictorClass):
+        """
+        :param train: feature rows of the training hashtags, as features.csv holds them
+        :param predictorClass: predictor whose extractLabels buckets are learned, e.g. DecisionTree
+        """
+        from sklearn import tree
+
+        train = train.copy()
+        labels = predictorClass(train=train, test=train.head(0)).train_data["label"]
+
+        self.columns = train.columns.drop(["hashtag", "label"] + self.LABEL_COLUMNS, errors="ignore")
+        self.classifier = tree.DecisionTreeClassifier()
+        self.classifier.fit(train[self.columns], labels)
+
+    def predict(self, rows):
+        """
+            :return: the popularity bucket of every feature row
+        """
+        data = pd.DataFrame(rows).reindex(columns=self.columns, fill_value=0)
+        return self.classifier.predict(data)
+
+class StreamService:
+
+    """
+        Predicts the popularity bucket of the hashtags of a tweet stream while they emerge.
+        Every tweet updates the sliding window of a WindowFeatureExtractor. The hashtags updated since the last
+        emission are predicted together every emit_interval seconds.
+        Emission and expiry are driven by time: while the source is idle, the stream clock advances from the
+        last tweet by the wall time since it arrived, and the tweets the window moves past are dropped.
+    """
+
+    def __init__(self, windowFeatureExtractor, model, emit_interval=1.0):
+        self.windowFeatureExtractor = windowFeatureExtractor
+        self.model = model
+        self.emit_interval = emit_interval
+
+    def run(self, source):
+        """
+            :param source: iterable of tweet json, such as a JsonlTweetSource or a SocketTweetSource. None items
+            mark an idle poll of the source
+            :return: generator of lists of (hashtag, popularity bucket, feature row) predictions
+        """
+        updated = set()
+        last_emit = time.time()
+        last_created_at = None # stream time of the last tweet
+        last_arrival = None # wall time it arrived at
+        for tweet in source:
+            if tweet is not None:
+                updated.update(self.windowFeatureExtractor.add_tweet(tweet))
+                last_created_at = tweet["created_at"]
+                last_arrival = time.time()
+            elif last_created_at is not None:
+                now = last_created_at + timedelta(seconds=time.time() - last_arrival)
+                updated.update(self.windowFeatureExtractor.expire(now))
+
+            if time.time() - last_emit >= self.emit_interval:
+                predictions = self.predict(updated)
+                if predictions:
+                    yield predictions
+                updated = set()
+                last_emit = time.time()
+
+        predictions = self.predict(updated)
+        if predictions:
+            yield predictions
+
+    def predict(self, hashtags):
+        rows = [self.windowFeatureExtractor.get_hashtag_row(hashtag) for hashtag in hashtags]
+        rows = [row for row in rows if row is not None]
+        if not rows:
+            return []
+
+        labels = self.model.predict(rows)
+        return [(row["hashtag"], label, row) for row, label in zip(rows, labels)]
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+import threading
+
+class TweetCache:
+
+    """
+        Bounded LRU cache of the tweets fetched per hashtag, shared by every extractor of a DbHandler.
+        Size is measured in tweets rather than entries, so a few popular hashtags cannot take more memory
+        than the bound allows.
+    """
+
+    def __init__(self, max_tweets=500000):
+        self.max_tweets = max_tweets
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock() # the cache is shared by the worker threads of AsyncDbHandler
+
+    def get(self, key):
+        """
+            :return: the cached tweets of the key, or None on a miss
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return self.__entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, tweets):
+        """
+            Caches the tweets of the key, evicting the least recently used entries until the cache fits its bound.
+            Lists larger than the whole cache are not cached.
+        """
+        if len(tweets) > self.max_tweets:
+            return
+
+        with self.__lock:
+            if key in self.__entries:
+                self.size -= len(self.__entries.pop(key))
+
+            self.__entries[key] = tweets
+            self.size += len(tweets)
+
+            while self.size > self.max_tweets:
+                _, evicted = self.__entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def getStatistics(self):
+        """
+            :return: dictionary of hits, misses, cached entries and cached tweets
+        """
+        with self.__lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.__entries), "tweets": self.size}
@@ -1,10 +1,28 @@
 from tqdm import tqdm
+from collections import deque
+import asyncio
+import functools
+import itertools
 import DbHandler
+import AsyncDbHandler
+import SnapshotDbHandler
+import StreamService
 import PlotFactory
+import LDA
 from FeatureExtractors.FeatureExtractor import FeatureExtractor
 from FeatureExtractors.HashtagFeatureExtractor import HashtagFeatureExtractor
 from FeatureExtractors.TweetFeatureExtractor import TweetFeatureExtractor
+from FeatureExtractors.SinglePassFeatureExtractor import SinglePassFeatureExtractor
+from FeatureExtractors.ParallelFeatureExtractor import ParallelFeatureExtractor
 from FeatureExtractors.IOHandler import IOHandler
+from FeatureExtractors.SentimentStore import SentimentStore
+from FeatureExtractors.RunManifest import RunManifest
+from FeatureExtractors.IncrementalRefresher import IncrementalRefresher
+from FeatureExtractors.CorpusStatisticsCache import CorpusStatisticsCache
+from FeatureExtractors.CooccurrenceGraph import CooccurrenceGraph, GRAPH_SCHEMA
+from FeatureExtractors.WindowFeatureExtractor import WindowFeatureExtractor
+from FeatureExtractors.FeatureSink import FeatureSink, FEATURE_SCHEMA, TOPIC_SCHEMA
+from FeatureExtractors.FeatureStore import FeatureStore
 from Predictors.DBScan import DBScan
 from Predictors.GRUNN import GRUNN
 from Predictors.NaiveBayes import NaiveBayes
@@ -18,59 +36,287 @@ from Predictors.PriorDist import PriorDist
 CLUSTERING = "SVM"
 FEATURE_EXTRACTION = False
 CREATE_CSV = False
+CREATE_INDEX = False # build the hashtag -> tweet index once, hashtag lookups use it afterwards
+EXPORT_SNAPSHOT = False # export the collection to an offline columnar snapshot
+DATA_SOURCE = "mongo" # "mongo" or "snapshot"
+SNAPSHOT_PATH = "snapshot"
+
+MONGO_URI = "mongodb://localhost:27017/"
+MONGO_DATABASE = "Test_db"
+MONGO_COLLECTION = "plastic"
+MONGO_POOL_SIZE = 100
+TWEET_CACHE_SIZE = 500000 # tweets kept by the per-hashtag tweet cache
+HASHTAG_BLOCK_SIZE = 200 # hashtags whose tweets are fetched in one round trip
+EXTRACTION_MODE = "sequential" # "sequential", "async", "single_pass", "parallel" or "incremental"
+CONCURRENT_QUERIES = 4 # hashtag blocks kept in flight by the async extraction loop
+PARALLEL_PROCESSES = None # worker processes of the parallel extraction, None for one per core
+SENTIMENT_STORE_PATH = "sentiments.sqlite" # persistent per tweet sentiments, None to score without a store
+PRECOMPUTE_SENTIMENTS = False # score the whole collection into the sentiment store in one pass
+FEATURES_FORMAT = "csv" # "csv", "parquet" or "feather". Only csv runs can be resumed
+FEATURES_PATH = "features." + FEATURES_FORMAT # the extension selects the reader of IOHandler.readFeatures
+RESUME_EXTRACTION = True # continue an interrupted sequential or async run from its last checkpoint
+REFRESH_STATE_PATH = "refresh_state.pickle" # watermark and corpus statistics of the incremental refreshes
+CORPUS_STATISTICS_PATH = "corpus_statistics.npz" # cached precalculateValues results, None to always recompute
+TOP_K_CAPACITY = 10000 # counters of the top K hashtag sketch
+EXACT_TOP_K = False # count the top K candidates exactly in a second pass
+TRAINING_FEATURES_PATH = "features_related.csv" # feature table the predictors are trained on
+FEATURE_STORE_PATH = "feature_store" # memory mapped copy of the training features, rebuilt when they change
+COOCCURRENCE_GRAPH_PATH = "cooccurrence_graph.npz" # hashtag co-occurrence graph, rebuilt when the collection changes
+USE_COOCCURRENCE_GRAPH = False # read the co-occurrence flag of the sequential and async runs from the graph
+GRAPH_FEATURES = False # write the degree, weighted degree and PageRank of the hashtags
+GRAPH_FEATURES_PATH = "graph_features.csv"
+TOPIC_MODEL_PATH = "topic_model.lda" # corpus LDA model, its dictionary and the hashtag topic table
+TRAIN_TOPIC_MODEL = False # train the topic model on the whole collection and save it
+TOPIC_FEATURE = False # add the hashtag topic column to the sequential and async runs, needs a trained model
+STREAMING = False # predict the popularity of the hashtags of a live tweet stream
+STREAM_SOURCE = "tweets.jsonl" # json lines file, or "host:port" of a socket streaming json lines
+STREAM_FOLLOW = True # keep reading the file as it grows
+STREAM_WINDOW_SECONDS = 3600 # sliding window the stream features are computed over
+STREAM_EMIT_INTERVAL = 1.0 # seconds between two rounds of predictions
 
 def createFeatureCSV(db_handler, ioHandler):
     """
         Processes tweets and hashtags to produce the necessary features.
         Writes the features in a CSV.
     """
-    feature_extractor = FeatureExtractor(db_handler)
+    db_handler.ensureIndexes()
+    sentiment_store = SentimentStore(SENTIMENT_STORE_PATH) if SENTIMENT_STORE_PATH else None
+    feature_extractor = FeatureExtractor(db_handler, sentimentStore=sentiment_store)
 
     if CREATE_CSV:
         print("Extracting hashtags from tweets")
-        #feature_extractor.create_hashtag_csv(ioHandler)
-        feature_extractor.create_top_k_csv(ioHandler)
+        feature_extractor.create_hashtag_csvs(ioHandler, capacity=TOP_K_CAPACITY, exact=EXACT_TOP_K)
+    elif CREATE_INDEX:
+        requireMongo("CREATE_INDEX")
+        print("Building hashtag index")
+        feature_extractor.create_hashtag_index()
+    elif PRECOMPUTE_SENTIMENTS:
+        print("Scoring tweet sentiments")
+        sentiment_store.populate(db_handler, feature_extractor)
+    elif GRAPH_FEATURES:
+        print("Computing hashtag graph features")
+        hashtags = [str(hashtag) for hashtag in ioHandler.readFromCSV("hashtags.csv")["hashtag"]]
+        graph = getCooccurrenceGraph(db_handler, feature_extractor)
+        with FeatureSink(GRAPH_FEATURES_PATH, schema=GRAPH_SCHEMA) as sink:
+            sink.write_rows(graph.get_graph_rows(hashtags))
+    elif TRAIN_TOPIC_MODEL:
+        print("Training topic model")
+        topic_model = LDA.TopicModel.train(db_handler, feature_extractor, TOPIC_MODEL_PATH)
+        topic_model.save(TOPIC_MODEL_PATH)
+    elif EXPORT_SNAPSHOT:
+        requireMongo("EXPORT_SNAPSHOT")
+        print("Exporting snapshot")
+        tweet_feature_extractor = TweetFeatureExtractor(featureExtractor=feature_extractor)
+        SnapshotDbHandler.SnapshotDbHandler.exportSnapshot(db_handler, tweet_feature_extractor, SNAPSHOT_PATH)
+    elif EXTRACTION_MODE == "single_pass":
+        hashtags = [str(hashtag) for hashtag in ioHandler.readFromCSV("hashtags.csv")["hashtag"]]
+
+        manifest = RunManifest(FEATURES_PATH, hashtags, getRunVersion(FEATURE_SCHEMA))
+        manifest.begin(resume=False) # rows are only written once the scan is over
+
+        single_pass_extractor = SinglePassFeatureExtractor(featureExtractor=feature_extractor)
+        with FeatureSink(manifest.partial_path, FEATURES_FORMAT, schema=FEATURE_SCHEMA) as sink:
+            sink.write_rows(single_pass_extractor.get_features(hashtags))
+        manifest.commit()
+    elif EXTRACTION_MODE == "parallel":
+        hashtags = [str(hashtag) for hashtag in ioHandler.readFromCSV("hashtags.csv")["hashtag"]]
+
+        parallel_extractor = ParallelFeatureExtractor(getDbHandlerFactory(), processes=PARALLEL_PROCESSES,
+                                                      block_size=HASHTAG_BLOCK_SIZE,
+                                                      sentimentStorePath=SENTIMENT_STORE_PATH,
+                                                      statisticsPath=CORPUS_STATISTICS_PATH,
+                                                      format=FEATURES_FORMAT)
+        parallel_extractor.run(hashtags, FEATURES_PATH)
+    elif EXTRACTION_MODE == "incremental":
+        requireMongo("The incremental extraction mode")
+        hashtags = [str(hashtag) for hashtag in ioHandler.readFromCSV("hashtags.csv")["hashtag"]]
+
+        refresher = IncrementalRefresher(featureExtractor=feature_extractor, state_path=REFRESH_STATE_PATH,
+                                         block_size=HASHTAG_BLOCK_SIZE, format=FEATURES_FORMAT)
+        refreshed = refresher.refresh(hashtags, FEATURES_PATH)
+        print("Refreshed", len(refreshed), "hashtags")
     else:
         hashtag_feature_extractor = HashtagFeatureExtractor(featureExtractor=feature_extractor)
         tweet_feature_extractor = TweetFeatureExtractor(featureExtractor=feature_extractor)
-        tweet_feature_extractor.precalculateValues()
+        tweet_feature_extractor.precalculateValues(CorpusStatisticsCache(CORPUS_STATISTICS_PATH)
+                                                   if CORPUS_STATISTICS_PATH else None)
+        # hashtag lookups return TweetRecords, converted once per block before they are cached
+        db_handler.setTweetConverter(tweet_feature_extractor.get_tweet_record)
+        if USE_COOCCURRENCE_GRAPH:
+            hashtag_feature_extractor.cooccurrence_graph = getCooccurrenceGraph(db_handler, feature_extractor)
+        schema = FEATURE_SCHEMA
+        if TOPIC_FEATURE:
+            tweet_feature_extractor.topic_model = LDA.TopicModel.load(TOPIC_MODEL_PATH)
+            if tweet_feature_extractor.topic_model is None:
+                raise FileNotFoundError("No topic model at {}, train it with TRAIN_TOPIC_MODEL".format(TOPIC_MODEL_PATH))
+            schema = FEATURE_SCHEMA + TOPIC_SCHEMA
+
+        hashtags = [str(hashtag) for hashtag in ioHandler.readFromCSV("hashtags.csv")["hashtag"]]
+
+        manifest = RunManifest(FEATURES_PATH, hashtags, getRunVersion(schema))
+        completed = manifest.begin(resume=RESUME_EXTRACTION and FEATURES_FORMAT == "csv")
+        if completed:
+            print("Resuming after", completed, "completed hashtags")
+
+        # the manifest has emptied the partial file or truncated it to its last checkpoint
+        sink = FeatureSink(manifest.partial_path, FEATURES_FORMAT, schema=schema, append=FEATURES_FORMAT == "csv")
+        if EXTRACTION_MODE == "async":
+            async_db_handler = AsyncDbHandler.AsyncDbHandler(db_handler, max_workers=CONCURRENT_QUERIES)
+            loop = asyncio.get_event_loop()
+            loop.run_until_complete(extractFeaturesAsync(async_db_handler, sink, hashtags, manifest,
+                                                         hashtag_feature_extractor, tweet_feature_extractor))
+            async_db_handler.close()
+        else:
+            for start in tqdm(range(completed, len(hashtags), HASHTAG_BLOCK_SIZE)):
+                block = hashtags[start:start + HASHTAG_BLOCK_SIZE]
+                block_tweets = db_handler.getTweetsForHashtags(block)
+
+                sink.write_rows(extractFeatures(hashtag, block_tweets[hashtag], hashtag_feature_extractor,
+                                                tweet_feature_extractor) for hashtag in block)
+
+                sink.flush()
+                manifest.checkpoint(start + len(block))
+
+        sink.close()
+        manifest.commit()
 
-        hashtags = ioHandler.readFromCSV("hashtags.csv")["hashtag"]
+        print("Tweet cache: ", db_handler.tweet_cache.getStatistics())
 
-        for index, hashtag in tqdm(enumerate(hashtags)):
-            features = {}
-            print("Hashtag: ", hashtag)
-            features.update({"hashtag": hashtag})
 
-            hashtag_features = hashtag_feature_extractor.get_hashtag_features(hashtag)
-            features.update(hashtag_features)
+async def extractFeaturesAsync(async_db_handler, sink, hashtags, manifest, hashtag_feature_extractor,
+                               tweet_feature_extractor):
+    """
+        Keeps CONCURRENT_QUERIES hashtag blocks in flight while the features of the already fetched blocks
+        are computed. Rows are written in the order of hashtags, after the hashtags the manifest has completed,
+        and checkpointed after every block.
+    """
+    blocks = (hashtags[start:start + HASHTAG_BLOCK_SIZE]
+              for start in range(manifest.completed, len(hashtags), HASHTAG_BLOCK_SIZE))
+
+    in_flight = deque()
+    for block in itertools.islice(blocks, CONCURRENT_QUERIES):
+        in_flight.append((block, asyncio.ensure_future(async_db_handler.getTweetsForHashtags(block))))
+
+    index = manifest.completed
+    with tqdm(total=len(hashtags), initial=index) as progress:
+        while in_flight:
+            block, query = in_flight.popleft()
+            block_tweets = await query
+
+            # refill the window before computing, so the query runs while this block is processed
+            for next_block in itertools.islice(blocks, 1):
+                in_flight.append((next_block, asyncio.ensure_future(async_db_handler.getTweetsForHashtags(next_block))))
+
+            sink.write_rows(extractFeatures(hashtag, block_tweets[hashtag], hashtag_feature_extractor,
+                                            tweet_feature_extractor) for hashtag in block)
+            index += len(block)
+
+            sink.flush()
+            manifest.checkpoint(index)
+            progress.update(len(block))
 
-            tweet_features = tweet_feature_extractor.get_tweet_features(hashtag)
-            features.update(tweet_features)
 
-            if index == 0:
-                header = True
-            else:
-                header = False
+def getRunVersion(schema):
+    """
+        Returns the RunManifest version of a run writing the columns of schema, the same in every extraction mode,
+        so runs writing other values or other columns are not resumed
+    """
+    return [FeatureExtractor.VERSION, [column for column, _ in schema]]
+
+
+def extractFeatures(hashtag, tweets, hashtag_feature_extractor, tweet_feature_extractor):
+    """
+        Computes the feature row of a hashtag from its already fetched tweets.
+    """
+    features = {}
+    print("Hashtag: ", hashtag)
+    features.update({"hashtag": hashtag})
 
-            ioHandler.writeToCSV(features, header)
+    hashtag_features = hashtag_feature_extractor.get_hashtag_features(hashtag, tweets)
+    features.update(hashtag_features)
+
+    tweet_features = tweet_feature_extractor.get_tweet_features(hashtag, tweets)
+    features.update(tweet_features)
+
+    return features
+
+
+def getCooccurrenceGraph(db_handler, feature_extractor):
+    """
+        Loads the co-occurrence graph of the collection, building and saving it if the collection has changed.
+    """
+    fingerprint = db_handler.getCollectionFingerprint()
+    graph = CooccurrenceGraph.load(COOCCURRENCE_GRAPH_PATH, fingerprint)
+    if graph is None:
+        print("Building hashtag co-occurrence graph")
+        graph = CooccurrenceGraph.build(db_handler, feature_extractor)
+        graph.save(COOCCURRENCE_GRAPH_PATH, fingerprint)
+    return graph
+
+
+def predictStream(db_handler, ioHandler):
+    """
+        Trains a popularity model on the extracted features and predicts the hashtags of the tweet stream
+        while they emerge.
+    """
+    tweet_feature_extractor = TweetFeatureExtractor(db_handler)
+    tweet_feature_extractor.precalculateValues(CorpusStatisticsCache(CORPUS_STATISTICS_PATH)
+                                               if CORPUS_STATISTICS_PATH else None)
+    window_feature_extractor = WindowFeatureExtractor(window_seconds=STREAM_WINDOW_SECONDS,
+                                                      corpusStatistics=tweet_feature_extractor.get_corpus_statistics())
+
+    model = StreamService.PopularityModel(ioHandler.readFeatures(TRAINING_FEATURES_PATH), DecisionTree)
+    service = StreamService.StreamService(window_feature_extractor, model, emit_interval=STREAM_EMIT_INTERVAL)
+
+    if ":" in STREAM_SOURCE:
+        host, port = STREAM_SOURCE.rsplit(":", 1)
+        source = StreamService.SocketTweetSource(host, int(port), poll_interval=STREAM_EMIT_INTERVAL)
+    else:
+        source = StreamService.JsonlTweetSource(STREAM_SOURCE, follow=STREAM_FOLLOW,
+                                                  poll_interval=STREAM_EMIT_INTERVAL)
+
+    for predictions in service.run(source):
+        for hashtag, label, features in predictions:
+            print("Hashtag: ", hashtag, "popularity bucket:", label, "tweets in window:", features["popularity"])
+
+
+def requireMongo(mode):
+    """
+        Rejects a mode that queries or writes the tweet collection before it starts, when the data source is a
+        read only snapshot
+    """
+    if DATA_SOURCE == "snapshot":
+        raise ValueError("{} needs DATA_SOURCE = \"mongo\", snapshots do not support queries".format(mode))
+
+
+def getDbHandlerFactory():
+    """
+        Returns a picklable callable creating the configured db handler, so worker processes can create their own.
+    """
+    if DATA_SOURCE == "snapshot":
+        return functools.partial(SnapshotDbHandler.SnapshotDbHandler, SNAPSHOT_PATH, cache_size=TWEET_CACHE_SIZE)
+    else:
+        return functools.partial(DbHandler.DbHandler, uri=MONGO_URI, database=MONGO_DATABASE,
+                                 collection=MONGO_COLLECTION, pool_size=MONGO_POOL_SIZE, cache_size=TWEET_CACHE_SIZE)
 
 
 if __name__ == '__main__':
-    db_handler = DbHandler.DbHandler()
+    db_handler = getDbHandlerFactory()()
     ioHandler = IOHandler()
-    if FEATURE_EXTRACTION:
+    if STREAMING:
+        predictStream(db_handler, ioHandler)
+    elif FEATURE_EXTRACTION:
         createFeatureCSV(db_handler, ioHandler)
     else:
-        top_hashtags = ioHandler.readFromCSV("top_k.csv")
-
-        data = ioHandler.readFromCSV("features_related.csv")
-
-        test_data = data.loc[data["hashtag"].isin(top_hashtags["hashtag"])]
-        test_data = test_data.reset_index(drop=True)
+        if not FeatureStore.isCurrent(FEATURE_STORE_PATH, [TRAINING_FEATURES_PATH, "top_k.csv"]):
+            print("Building feature store")
+            FeatureStore.buildTrainTest(ioHandler.readFeatures(TRAINING_FEATURES_PATH),
+                                        ioHandler.readFromCSV("top_k.csv")["hashtag"], FEATURE_STORE_PATH)
+        feature_store = FeatureStore(FEATURE_STORE_PATH)
 
-        train_data = data.loc[~data["hashtag"].isin(top_hashtags["hashtag"])]
-        train_data = train_data.reset_index(drop=True)
+        # the top k hashtags are the test set
+        test_data = feature_store.read(mask="test")
+        train_data = feature_store.read(mask="train")
 
 
         # plot_factory = PlotFactory.PlotFactory(db_handler, data)